@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+
+from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo, MessageEntity
+
+from metrics import HANDLER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Album items arrive as separate updates a few hundred ms apart; an album is complete
+# once no new item showed up for this many seconds
+ALBUM_WINDOW = float(os.getenv('ALBUM_WINDOW', '1.0'))
+
+MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio
+}
+
+def media_item(msg):
+    # JSON-safe description of one album item; broadcast jobs persist these as they are
+    if msg.photo:
+        item = {'type': 'photo', 'media': msg.photo[-1].file_id}
+    elif msg.video:
+        item = {'type': 'video', 'media': msg.video.file_id}
+    elif msg.document:
+        item = {'type': 'document', 'media': msg.document.file_id}
+    elif msg.audio:
+        item = {'type': 'audio', 'media': msg.audio.file_id}
+    else:
+        return None
+    if msg.caption:
+        item['caption'] = msg.caption
+        item['caption_entities'] = [entity.to_dict() for entity in msg.caption_entities]
+    return item
+
+def input_media(item, caption=None, parse_mode=None):
+    # caption replaces the item's own caption and formatting, e.g. with the forward header
+    media_type = MEDIA_TYPES[item['type']]
+    if caption is not None:
+        return media_type(item['media'], caption=caption, parse_mode=parse_mode)
+    entities = [MessageEntity.de_json(entity, None) for entity in item.get('caption_entities', ())]
+    return media_type(item['media'], caption=item.get('caption'), caption_entities=entities or None)
+
+class AlbumCollector:
+    # Telegram delivers an album as one update per item, all sharing a media_group_id.
+    # The first item starts a collection with the callback that will send the whole
+    # album; later items only join it. Every item re-arms the timer, and once it fires
+    # the callback runs as an application task with the items in message order.
+    # Until then hold() keeps the chat's later updates back, so nothing the sender did
+    # after the album overtakes it.
+    def __init__(self, application, window=ALBUM_WINDOW):
+        self.application = application
+        self.window = window
+        # (chat_id, media_group_id) -> [messages, timer, callback]
+        self.pending = {}
+        # chat_id -> [albums collecting or sending, event set once the last one is sent]
+        self.chats = {}
+    
+    def start(self, msg, callback):
+        key = (msg.chat_id, msg.media_group_id)
+        timer = asyncio.get_running_loop().call_later(self.window, self.flush, key)
+        self.pending[key] = [[msg], timer, callback]
+        entry = self.chats.get(msg.chat_id)
+        if entry is None:
+            entry = self.chats[msg.chat_id] = [0, asyncio.Event()]
+        entry[0] += 1
+    
+    async def hold(self, update):
+        # ChatOrderedProcessor runs this in the update's turn in its chat. Items of an album
+        # still being collected go through to join it, anything else waits for the chat's albums.
+        chat = update.effective_chat
+        entry = self.chats.get(chat.id) if chat else None
+        if entry is None:
+            return
+        msg = update.message
+        if msg and msg.media_group_id and (chat.id, msg.media_group_id) in self.pending:
+            return
+        await entry[1].wait()
+    
+    def join(self, msg):
+        # True when msg belongs to an album that is already being collected
+        if not msg.media_group_id:
+            return False
+        key = (msg.chat_id, msg.media_group_id)
+        album = self.pending.get(key)
+        if album is None:
+            return False
+        album[0].append(msg)
+        album[1].cancel()
+        album[1] = asyncio.get_running_loop().call_later(self.window, self.flush, key)
+        return True
+    
+    def flush(self, key):
+        messages, _, callback = self.pending.pop(key)
+        messages.sort(key=lambda m: m.message_id)
+        logger.debug(f"🖼 Album {key[1]} complete with {len(messages)} items")
+        self.application.create_task(self.send(key[0], callback, messages))
+    
+    async def send(self, chat_id, callback, messages):
+        # Timed like the handler it finishes, under the callback's name
+        name = getattr(callback, 'func', callback).__name__
+        try:
+            with HANDLER_SECONDS.time(name, 'album'):
+                await callback(messages)
+        finally:
+            entry = self.chats[chat_id]
+            entry[0] -= 1
+            if not entry[0]:
+                del self.chats[chat_id]
+                entry[1].set()
+
@@ -0,0 +1,211 @@
+"""Compare update throughput with sequential and chat-ordered concurrent processing.
+
+Runs handle_user_message in a real Application against a local stand-in for
+the Bot API that answers every call after a fixed round trip. Messages whose
+text contains SLOW take an extra delay, like a large photo upload. Each of
+--users users sends --messages messages, all queued at once. Sequential
+processing makes everyone wait behind each slow send. Concurrent processing
+only delays later messages from the same user. The benchmark also checks that
+every user's messages reach the owner in the order they were sent.
+
+A second run queues many slow messages from one chat before one message
+from each other user. Those users should only wait for a free slot, never
+behind the busy chat.
+
+Forwards run in the background through ForwardQueue, which gets the same
+concurrency as update processing here.
+
+The outbound rate limits are lifted, so the numbers show update processing,
+not Telegram's send caps.
+
+    python benchmarks/bench_concurrency.py --users 50 --messages 10 --rtt 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix='bench_concurrency_'))
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from albums import AlbumCollector
+from database import Database
+from flood import FloodControl
+from ingress import ChatOrderedProcessor
+from outbound import OutboundScheduler
+from user_handlers import FORWARD_DRAIN_TIMEOUT, ForwardQueue, handle_user_message
+
+TOKEN = '123456:bench'
+API_PORT = 18082
+OWNER_ID = 1
+TAG = re.compile(r'msg (\d+):(\d+) ([\d.]+)')
+
+logging.getLogger('aiohttp.server').setLevel(logging.CRITICAL)
+
+class FakeBotAPI:
+    def __init__(self, rtt, slow):
+        self.rtt = rtt
+        self.slow = slow
+        self.next_id = 1
+        self.forwarded = []
+        self.web = web.Application()
+        self.web.router.add_post('/bot{token}/{method}', self.handle)
+    
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        text = params.get('text', '')
+        await asyncio.sleep(self.rtt + (self.slow if 'SLOW' in text else 0))
+        
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {
+                'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'
+            }})
+        if method == 'sendMessage':
+            tag = TAG.search(text)
+            if tag and int(params['chat_id']) == OWNER_ID:
+                user, seq, sent_at = tag.groups()
+                self.forwarded.append((int(user), int(seq), time.perf_counter() - float(sent_at)))
+            self.next_id += 1
+            return web.json_response({'ok': True, 'result': {
+                'message_id': self.next_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': text
+            }})
+        return web.json_response({'ok': True, 'result': True})
+
+def make_update(update_id, user_id, seq, slow):
+    text = f"msg {user_id}:{seq} {time.perf_counter()}" + (" SLOW" if slow else "")
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'text': text
+        }
+    }
+
+async def start_bot(rtt, slow, concurrency, burst, name):
+    api = FakeBotAPI(rtt, slow)
+    runner = web.AppRunner(api.web, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', API_PORT).start()
+    
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f'http://127.0.0.1:{API_PORT}/bot')
+        .rate_limiter(OutboundScheduler(rate=1e9, chat_rate=1e9, chat_burst=1e9))
+        .concurrent_updates(ChatOrderedProcessor(concurrency))
+        .build()
+    )
+    app.bot_data['OWNER_ID'] = OWNER_ID
+    app.bot_data['db'] = Database(f'data_{name}.json')
+    app.bot_data['flood'] = FloodControl(burst=burst)
+    app.bot_data['albums'] = AlbumCollector(app)
+    app.bot_data['forwards'] = ForwardQueue(app, concurrency)
+    app.add_handler(MessageHandler(filters.TEXT, handle_user_message))
+    
+    await app.initialize()
+    await app.start()
+    return api, runner, app
+
+async def stop_bot(api, runner, app, drain=FORWARD_DRAIN_TIMEOUT):
+    await app.stop()
+    await app.bot_data['forwards'].stop(drain)
+    await app.shutdown()
+    await app.bot_data['db'].close()
+    await runner.cleanup()
+
+async def run(concurrency, users, messages, slow_every, rtt, slow):
+    api, runner, app = await start_bot(rtt, slow, concurrency, messages, concurrency)
+    
+    total = users * messages
+    started = time.perf_counter()
+    update_id = 0
+    # Same slow messages in both runs, spread over users
+    rng = random.Random(1)
+    for seq in range(messages):
+        for user in range(users):
+            update_id += 1
+            data = make_update(update_id, 1000 + user, seq, rng.random() < 1 / slow_every)
+            await app.update_queue.put(Update.de_json(data, app.bot))
+    while len(api.forwarded) < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await stop_bot(api, runner, app)
+    
+    last = {}
+    in_order = True
+    for user, seq, _ in api.forwarded:
+        in_order = in_order and seq > last.get(user, -1)
+        last[user] = seq
+    latencies = sorted(latency for _, _, latency in api.forwarded)
+    return {
+        'concurrency': concurrency,
+        'updates_per_s': total / elapsed,
+        'mean_ms': sum(latencies) / total * 1000,
+        'p99_ms': latencies[int(total * 0.99) - 1] * 1000,
+        'in_order': in_order
+    }
+
+async def run_busy(concurrency, busy, idle, rtt, slow):
+    # One chat queues --busy slow messages, then --idle other users send one each.
+    # The idle users should only wait for a free slot, never for the busy chat.
+    api, runner, app = await start_bot(rtt, slow, concurrency, busy, f'busy_{concurrency}')
+    
+    update_id = 0
+    for seq in range(busy):
+        update_id += 1
+        await app.update_queue.put(Update.de_json(make_update(update_id, 999, seq, True), app.bot))
+    for user in range(idle):
+        update_id += 1
+        await app.update_queue.put(Update.de_json(make_update(update_id, 1000 + user, 0, False), app.bot))
+    while sum(1 for user, _, _ in api.forwarded if user != 999) < idle:
+        await asyncio.sleep(0.01)
+    # What is left of the busy chat's backlog doesn't matter here
+    await stop_bot(api, runner, app, drain=0)
+    
+    latencies = sorted(latency for user, _, latency in api.forwarded if user != 999)
+    return {
+        'mean_ms': sum(latencies) / idle * 1000,
+        'p99_ms': latencies[int(idle * 0.99) - 1] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=10, help="messages per user")
+    parser.add_argument('--slow-every', type=int, default=20, help="about one in N messages is slow")
+    parser.add_argument('--rtt', type=float, default=0.05, help="simulated Bot API round trip in seconds")
+    parser.add_argument('--slow', type=float, default=1.0, help="extra seconds for a slow send")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--busy', type=int, default=100, help="slow messages queued by one busy chat")
+    args = parser.parse_args()
+    
+    print(f"{args.users} users x {args.messages} messages, 1 in {args.slow_every} sends "
+          f"{args.slow * 1000:.0f} ms slower, {args.rtt * 1000:.0f} ms round trip\n")
+    for concurrency in (1, args.concurrency):
+        r = asyncio.run(run(concurrency, args.users, args.messages, args.slow_every, args.rtt, args.slow))
+        mode = 'sequential' if concurrency == 1 else f'concurrent ({concurrency})'
+        print(f"{mode:>16}: {r['updates_per_s']:.1f} updates/s, mean {r['mean_ms']:.0f} ms, "
+              f"p99 {r['p99_ms']:.0f} ms, per-user order {'kept' if r['in_order'] else 'BROKEN'}")
+    
+    print(f"\nOne chat with {args.busy} slow messages queued, then {args.users} other users send one each")
+    r = asyncio.run(run_busy(args.concurrency, args.busy, args.users, args.rtt, args.slow))
+    print(f"{'other users':>16}: mean {r['mean_ms']:.0f} ms, p99 {r['p99_ms']:.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Microbenchmarks for the store's hot operations at 10k, 100k and 1M users.
+
+For every backend and size a synthetic store is built from a fixed seed, the
+same one bench_startup.py uses. It has 1% banned users, 200 pending payments
+and one message mapping per user. The store is then opened in a fresh
+subprocess and each operation runs until it has done --ops calls or used
+--budget seconds. Each operation records time per call (mean, p50, p99),
+bytes written per call (every write syscall the process made, SQLite
+included) and peak RSS growth while it ran. load is reopening the store after
+a first open that did any one-off import.
+
+--report writes the results as JSON. --baseline compares against an earlier
+report and exits with status 1 when time, bytes or memory grew by more than
+--threshold, so a storage regression fails the check before deploy. Results
+the baseline doesn't have, and baseline entries the run didn't measure, are
+listed; a run that matches nothing in the baseline fails. Timings only
+compare on the same machine; regenerate the baseline there first.
+
+    python benchmarks/bench_database.py --sizes 10000,100000 --report new.json --baseline benchmarks/baselines/database.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_startup import build_dataset, build_message_map
+
+# Owner message ids for new mappings start well past the synthetic ones
+NEW_MAPPINGS = 10 ** 9
+
+# Growth below these is noise, whatever the ratio
+FLOOR_US = 5.0
+FLOOR_BYTES = 512
+FLOOR_MB = 5.0
+
+def proc_value(path, key):
+    # Linux accounting from /proc/self; None elsewhere
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def written():
+    return proc_value('/proc/self/io', 'wchar:')
+
+def reset_peak():
+    # Restarts VmHWM at the current RSS so each operation gets its own peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    return proc_value('/proc/self/status', 'VmRSS:')
+
+def peak_growth_mb(baseline):
+    peak = proc_value('/proc/self/status', 'VmHWM:')
+    if peak is None or baseline is None:
+        return None
+    return max(0, peak - baseline) / 1024
+
+def operations(users):
+    # name -> fn(db, rng, i) for one call; i counts calls of that operation
+    def payment(db, rng, i):
+        payment = db.add_pending_payment(rng.randint(1, users), 7, 12, 'photo-file-id')
+        db.approve_payment(payment['id'])
+    
+    return {
+        'is_banned': lambda db, rng, i: db.is_banned(rng.randint(1, users)),
+        'get_user_from_msg': lambda db, rng, i: db.get_user_from_msg(rng.randint(1, users)),
+        'get_active_users': lambda db, rng, i: sum(1 for _ in db.get_active_users()),
+        'get_banned_users': lambda db, rng, i: sum(1 for _ in db.get_banned_users()),
+        'add_user': lambda db, rng, i: db.add_user(users + 1 + i, f'new{i}', f'New User {i}'),
+        'map_messages': lambda db, rng, i: db.map_messages(rng.randint(1, users), [NEW_MAPPINGS + i]),
+        'add_pending_payment+approve_payment': payment,
+        'save': lambda db, rng, i: db.save()
+    }
+
+def measure(fn, ops, budget):
+    times = []
+    before = written()
+    baseline = reset_peak()
+    deadline = time.perf_counter() + budget
+    while len(times) < ops:
+        started = time.perf_counter()
+        fn(len(times))
+        now = time.perf_counter()
+        times.append(now - started)
+        if now >= deadline:
+            break
+    after = written()
+    times.sort()
+    return {
+        'ops': len(times),
+        'mean_us': sum(times) / len(times) * 1e6,
+        'p50_us': times[len(times) // 2] * 1e6,
+        'p99_us': times[min(len(times) - 1, int(len(times) * 0.99))] * 1e6,
+        'bytes_per_op': (after - before) / len(times) if before is not None else None,
+        'peak_mb': peak_growth_mb(baseline)
+    }
+
+def child(directory, backend, users, ops, budget):
+    # Runs in its own process so RSS and written bytes belong to this store alone
+    os.environ['DB_BACKEND'] = backend
+    os.environ['DB_BACKUP_KEEP'] = '0'
+    # database.py opens a default store in the working directory on import
+    os.chdir(tempfile.mkdtemp(prefix='bench_database_cwd_'))
+    from database import open_database
+    
+    # The first open may import or compact; load measures a routine restart after that
+    asyncio.run(open_database(directory).close())
+    results = {}
+    stores = []
+    results['load'] = measure(lambda i: stores.append(open_database(directory)), 1, 0)
+    db = stores[0]
+    rng = random.Random(2)
+    for name, op in operations(users).items():
+        if name == 'save' and not hasattr(db, 'save'):
+            # SQLite commits every change as it happens, there is no snapshot to write
+            continue
+        results[name] = measure(lambda i: op(db, rng, i), ops, budget)
+    asyncio.run(db.close())
+    print(json.dumps(results))
+
+def build_store(directory, users):
+    from snapshots import encode, finish
+    
+    data = build_dataset(users, users)
+    with open(os.path.join(directory, 'data.json'), 'wb') as f:
+        f.write(finish(encode(data, 'json')))
+    build_message_map(os.path.join(directory, 'data_messages.db'), users, users)
+
+def run(args):
+    work = tempfile.mkdtemp(prefix='bench_database_')
+    results = []
+    try:
+        for users in args.sizes:
+            source = os.path.join(work, f'source_{users}')
+            os.makedirs(source)
+            build_store(source, users)
+            for backend in args.backends:
+                directory = os.path.join(work, f'{backend}_{users}')
+                shutil.copytree(source, directory)
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', directory, backend, str(users),
+                     '--ops', str(args.ops), '--budget', str(args.budget)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                for op, r in json.loads(out.strip().splitlines()[-1]).items():
+                    results.append({'backend': backend, 'users': users, 'op': op, **r})
+                shutil.rmtree(directory)
+            shutil.rmtree(source)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'ops': args.ops,
+            'budget_s': args.budget
+        },
+        'results': results
+    }
+
+def compare(report, baseline, threshold):
+    # (regressions, baseline entries the report lacks, report entries the baseline lacks),
+    # each as printable lines
+    base = {(r['backend'], r['users'], r['op']): r for r in baseline['results']}
+    seen = set()
+    regressions = []
+    unmatched = []
+    for r in report['results']:
+        key = (r['backend'], r['users'], r['op'])
+        old = base.get(key)
+        if not old:
+            unmatched.append('/'.join(map(str, key)))
+            continue
+        seen.add(key)
+        for field, floor, unit in (('mean_us', FLOOR_US, 'us'), ('bytes_per_op', FLOOR_BYTES, 'B'),
+                                   ('peak_mb', FLOOR_MB, 'MB')):
+            new_value, old_value = r.get(field), old.get(field)
+            if new_value is None or old_value is None:
+                continue
+            if new_value > old_value * threshold and new_value - old_value > floor:
+                regressions.append(
+                    f"{r['backend']}/{r['users']}/{r['op']}: {field} {old_value:.1f} -> {new_value:.1f} {unit}"
+                )
+    ran = {(r['backend'], r['users']) for r in report['results']}
+    missing = {}
+    for backend, users, op in base:
+        if (backend, users, op) in seen:
+            continue
+        # A backend and size the run skipped entirely is one entry, not one per operation
+        group = f'{backend}/{users}'
+        if (backend, users) in ran:
+            missing.setdefault(group, []).append(op)
+        else:
+            missing.setdefault(group, [])
+    missing = [f"{group} ({', '.join(ops)})" if ops else group for group, ops in missing.items()]
+    return regressions, missing, unmatched
+
+def print_report(report, baseline):
+    base = {(r['backend'], r['users'], r['op']): r for r in (baseline or {}).get('results', ())}
+    print(f"{'backend':>8} {'users':>8} {'operation':>36} {'ops':>6} {'mean':>11} {'p99':>11} "
+          f"{'bytes/op':>10} {'peak MB':>8}" + ("  vs baseline" if baseline else ""))
+    for r in report['results']:
+        line = (f"{r['backend']:>8} {r['users']:>8} {r['op']:>36} {r['ops']:>6} "
+                f"{r['mean_us']:>9.1f}us {r['p99_us']:>9.1f}us "
+                f"{r['bytes_per_op'] if r['bytes_per_op'] is not None else float('nan'):>10.0f} "
+                f"{r['peak_mb'] if r['peak_mb'] is not None else float('nan'):>8.1f}")
+        old = base.get((r['backend'], r['users'], r['op']))
+        if old:
+            line += f"  x{r['mean_us'] / old['mean_us']:.2f}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="comma-separated user counts")
+    parser.add_argument('--backends', default='json,journal,sqlite')
+    parser.add_argument('--ops', type=int, default=2000, help="most calls per operation")
+    parser.add_argument('--budget', type=float, default=1.0, help="seconds per operation, at least one call")
+    parser.add_argument('--report', help="write the results as JSON here")
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--threshold', type=float, default=1.5, help="allowed growth factor")
+    parser.add_argument('--child', nargs=3, metavar=('DIR', 'BACKEND', 'USERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        directory, backend, users = args.child
+        child(directory, backend, int(users), args.ops, args.budget)
+        return
+    
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+    args.backends = args.backends.split(',')
+    report = run(args)
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if baseline:
+        regressions, missing, unmatched = compare(report, baseline, args.threshold)
+        if unmatched:
+            print(f"\nNot in the baseline, not checked: {', '.join(unmatched)}")
+        if missing:
+            print(f"\nIn the baseline but not measured: {', '.join(missing)}")
+        if len(unmatched) == len(report['results']):
+            # Different sizes or backends than the baseline: a pass would mean nothing
+            print("\nNothing in the report matches the baseline")
+            sys.exit(1)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over x{args.threshold}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions over x{args.threshold}")
+
+if __name__ == '__main__':
+    main()
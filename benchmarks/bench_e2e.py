@@ -0,0 +1,251 @@
+"""End-to-end load test: the real bot against a local stand-in for the Bot API.
+
+Builds the Application with bot.build_application, points it at FakeBotAPI
+through base_url and long-polls synthetic traffic from it at --rate updates/s.
+Each of --users users sends /start, then text messages. The owner replies to
+forwarded messages, both sides tap inline buttons, and the owner starts
+--broadcasts broadcasts to everyone who has written so far. The run ends when
+every update has been handled and every broadcast has finished.
+
+Handler latency runs from the moment getUpdates hands an update to the bot
+until its handler returns. It includes time spent queued behind the same
+chat's earlier updates. API calls per update count every call the handlers
+and broadcasts made, leaving out polling and set-up.
+
+The fake server runs on the bot's event loop and takes a share of its CPU,
+so the figures are a lower bound. The outbound rate limits are lifted unless
+--telegram-limits is given.
+DB_* settings come from the environment as usual; the store lives in a
+temporary directory.
+
+    python benchmarks/bench_e2e.py --users 1000 --messages 3 --rate 50 --rtt 0.05 --flood-rate 0.001
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+OWNER_ID = 1
+TOKEN = '123456:bench'
+API_PORT = 18090
+
+def user_message(update_id, user_id, text, reply_to=None):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'},
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    if reply_to:
+        message['reply_to_message'] = {
+            'message_id': reply_to,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'text': 'forwarded'
+        }
+    return {'update_id': update_id, 'message': message}
+
+def callback_tap(update_id, user_id, data, message_id):
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(user_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'menu'
+            }
+        }
+    }
+
+class Traffic:
+    # Builds updates one at a time so owner replies can point at messages the bot really forwarded
+    def __init__(self, api, users, messages, reply_share, tap_share, broadcasts, seed=1):
+        self.api = api
+        self.rng = random.Random(seed)
+        self.reply_share = reply_share
+        self.tap_share = tap_share
+        self.update_id = 0
+        self.kinds = {}
+        # Every user's /start comes just before their first message; the rest is shuffled
+        sends = [1000 + u for u in range(users) for _ in range(messages)]
+        self.rng.shuffle(sends)
+        self.plan = []
+        started = set()
+        for user in sends:
+            if user not in started:
+                started.add(user)
+                self.plan.append(('start', user))
+            self.plan.append(('message', user))
+        # Broadcasts land evenly through the run
+        for i in range(broadcasts, 0, -1):
+            self.plan.insert(len(self.plan) * i // (broadcasts + 1), ('broadcast', OWNER_ID))
+    
+    def next_id(self, kind):
+        self.update_id += 1
+        self.kinds[self.update_id] = kind
+        return self.update_id
+    
+    def updates(self):
+        for kind, user in self.plan:
+            if kind == 'start':
+                yield user_message(self.next_id('start'), user, '/start')
+            elif kind == 'broadcast':
+                yield callback_tap(self.next_id('tap'), OWNER_ID, 'owner_broadcast', 1)
+                yield user_message(self.next_id('broadcast'), OWNER_ID, 'Broadcast from the load test')
+            else:
+                yield user_message(self.next_id('message'), user, f'Hello from {user}, message {self.update_id}')
+            yield from self.extras(user)
+    
+    def extras(self, user):
+        # Owner replies and button taps ride along with user traffic
+        if self.rng.random() < self.reply_share:
+            forwarded = [mid for chat, mid in self.api.sent[-200:] if chat == OWNER_ID]
+            if forwarded:
+                mid = self.rng.choice(forwarded)
+                yield user_message(self.next_id('reply'), OWNER_ID, 'Thanks, noted!', reply_to=mid)
+        if self.rng.random() < self.tap_share:
+            if self.rng.random() < 0.2:
+                yield callback_tap(self.next_id('tap'), OWNER_ID, 'owner_stats', 1)
+            else:
+                data = self.rng.choice(['paid_batches', 'user_help'])
+                yield callback_tap(self.next_id('tap'), user, data, 1)
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from telegram.warnings import PTBUserWarning
+    
+    from bot import build_application
+    from broadcast import running_broadcasts
+    from clones import CLONE_POOL_SIZE, SharedRequest
+    from database import db
+    from fake_bot_api import FakeBotAPI
+    
+    # bot.py's conversation handlers warn about per_message at build time
+    warnings.filterwarnings('ignore', category=PTBUserWarning)
+    logging.getLogger().setLevel(logging.ERROR)
+    logging.getLogger('aiohttp.server').setLevel(logging.CRITICAL)
+    
+    api = FakeBotAPI(rtt=args.rtt, jitter=args.jitter, flood_rate=args.flood_rate, retry_after=args.retry_after)
+    await api.start(API_PORT)
+    
+    # Same connection pool the main bot gets from CloneRuntime in bot.main()
+    request = SharedRequest(connection_pool_size=CLONE_POOL_SIZE)
+    app = build_application(TOKEN, OWNER_ID, 'Bench', db, request=request, base_url=api.base_url)
+    handled = {}
+    
+    async def mark_handled(update, context):
+        handled[update.update_id] = time.perf_counter()
+    
+    # Group 1 runs once the update's group 0 handler has returned
+    app.add_handler(TypeHandler(Update, mark_handled), group=1)
+    
+    await app.initialize()
+    await app.updater.start_polling(poll_interval=0.0, timeout=10, allowed_updates=Update.ALL_TYPES)
+    await app.start()
+    
+    traffic = Traffic(api, args.users, args.messages, args.reply_share, args.tap_share, args.broadcasts)
+    started = time.perf_counter()
+    pushed = 0
+    for update in traffic.updates():
+        api.push(update)
+        pushed += 1
+        if args.rate:
+            # Open loop: keep to the schedule however far behind the bot is
+            delay = started + pushed / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif pushed % 100 == 0:
+            await asyncio.sleep(0)
+    
+    while len(handled) < pushed:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    # Broadcasts keep sending after the update that started them was handled
+    while running_broadcasts(app):
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - started
+    
+    await app.updater.stop()
+    await app.stop()
+    await app.bot_data['forwards'].stop()
+    await app.shutdown()
+    await request.close()
+    await db.close()
+    await api.stop()
+    
+    latencies = sorted(handled[uid] - api.delivered[uid] for uid in handled)
+    by_kind = {}
+    for uid, kind in traffic.kinds.items():
+        by_kind.setdefault(kind, []).append(handled[uid] - api.delivered[uid])
+    calls = {method: n for method, n in api.calls.most_common() if method != 'getUpdates'}
+    return {
+        'updates': pushed,
+        'elapsed_s': elapsed,
+        'drained_s': drained,
+        'updates_per_s': pushed / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'by_kind': {kind: (len(v), sorted(v)[len(v) // 2] * 1000) for kind, v in by_kind.items()},
+        'calls_per_update': api.api_calls() / pushed,
+        'calls': calls,
+        'floods': sum(api.floods.values())
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=3, help="text messages per user")
+    parser.add_argument('--rate', type=float, default=50, help="updates pushed per second, 0 = all at once")
+    parser.add_argument('--reply-share', type=float, default=0.1, help="owner replies per user update")
+    parser.add_argument('--tap-share', type=float, default=0.1, help="button taps per user update")
+    parser.add_argument('--broadcasts', type=int, default=1)
+    parser.add_argument('--rtt', type=float, default=0.05, help="simulated Bot API round trip in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="up to this much extra per call")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="share of calls answered with a 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after of an injected 429")
+    parser.add_argument('--telegram-limits', action='store_true', help="keep the outbound rate limits")
+    args = parser.parse_args()
+    
+    os.environ['BOT_TOKEN'] = TOKEN
+    os.environ['OWNER_ID'] = str(OWNER_ID)
+    if not args.telegram_limits:
+        os.environ['OUTBOUND_RATE'] = '1e9'
+        os.environ['OUTBOUND_CHAT_RATE'] = '1e9'
+        os.environ['OUTBOUND_CHAT_BURST'] = '1e9'
+    # bot.py opens its store in the working directory on import
+    os.chdir(tempfile.mkdtemp(prefix='bench_e2e_'))
+    
+    r = asyncio.run(run(args))
+    
+    print(f"{r['updates']} updates from {args.users} users at "
+          f"{'max' if not args.rate else f'{args.rate:.0f}/s'}, {args.rtt * 1000:.0f} ms round trip, "
+          f"{r['floods']} injected 429s\n")
+    print(f"throughput: {r['updates_per_s']:.1f} updates/s, all handled after {r['elapsed_s']:.1f} s, "
+          f"broadcasts done after {r['drained_s']:.1f} s")
+    print(f"   latency: p50 {r['p50_ms']:.0f} ms, p99 {r['p99_ms']:.0f} ms")
+    for kind, (n, p50) in sorted(r['by_kind'].items()):
+        print(f"{kind:>10}: {n} updates, p50 {p50:.0f} ms")
+    print(f"\nAPI calls per update: {r['calls_per_update']:.2f}")
+    for method, n in r['calls'].items():
+        print(f"{method:>20}: {n}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compare the per-message cost of the single-call and split forwarding paths.
+
+Runs forward_messages, the background part of handle_user_message, against a
+stand-in bot that sleeps for a fixed round trip on every Bot API call, so the
+numbers show how many sequential calls each mode makes rather than real
+network time.
+
+    python benchmarks/bench_forwarding.py --messages 300 --rtt 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix='bench_forwarding_'))
+
+import user_handlers
+
+class FakeBot:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.calls = 0
+        self.next_id = 1
+    
+    async def call(self):
+        self.calls += 1
+        self.next_id += 1
+        await asyncio.sleep(self.rtt)
+        return SimpleNamespace(message_id=self.next_id)
+    
+    async def send_message(self, *args, **kwargs):
+        return await self.call()
+    
+    async def copy_message(self, *args, **kwargs):
+        return await self.call()
+
+def fake_update(bot, i):
+    user = SimpleNamespace(id=1000 + i % 50, first_name=f"User {i}", username=f"user{i}")
+    kind = i % 3
+    msg = SimpleNamespace(
+        chat_id=user.id,
+        message_id=i,
+        text="hello there" if kind == 0 else None,
+        caption="a photo" if kind == 1 else None,
+        photo=[object()] if kind == 1 else None,
+        sticker=object() if kind == 2 else None,
+        video=None, document=None, audio=None, animation=None, voice=None
+    )
+    
+    async def reply_text(text, **kwargs):
+        return await bot.call()
+    
+    msg.reply_text = reply_text
+    return SimpleNamespace(effective_user=user, message=msg)
+
+async def run(mode, messages, rtt):
+    user_handlers.FORWARD_MODE = mode
+    bot = FakeBot(rtt)
+    context = SimpleNamespace(bot=bot, bot_data={'OWNER_ID': 1})
+    
+    latencies = []
+    for i in range(messages):
+        update = fake_update(bot, i)
+        started = time.perf_counter()
+        await user_handlers.forward_messages(context, update.effective_user, [update.message])
+        latencies.append(time.perf_counter() - started)
+    
+    latencies.sort()
+    return {
+        'mode': mode,
+        'api_calls_per_message': bot.calls / messages,
+        'mean_ms': sum(latencies) / messages * 1000,
+        'p99_ms': latencies[int(messages * 0.99) - 1] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--rtt', type=float, default=0.05, help="simulated Bot API round trip in seconds")
+    args = parser.parse_args()
+    
+    print(f"{args.messages} messages (1/3 text, 1/3 photo, 1/3 sticker), {args.rtt * 1000:.0f} ms per call")
+    print("Calls include the greeting reply to the user.\n")
+    for mode in ('split', 'single'):
+        r = asyncio.run(run(mode, args.messages, args.rtt))
+        print(f"{r['mode']:>6}: {r['api_calls_per_message']:.2f} calls/msg, "
+              f"mean {r['mean_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Compare update-to-handler latency for long polling and webhook ingress.
+
+Runs a real Application against a local stand-in for the Bot API. The fake
+server delays every leg by half the given round trip. Updates arrive in
+short bursts after idle gaps. With polling, an update that lands while the
+previous getUpdates answer is in flight waits for the next round trip. With a
+webhook, each update is pushed as soon as it exists.
+
+    python benchmarks/bench_ingress.py --updates 200 --rtt 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, web
+from telegram.ext import Application, MessageHandler, filters
+
+from ingress import WebhookIngress, start_updates, stop_updates
+
+TOKEN = '123456:bench'
+API_PORT = 18081
+WEBHOOK_PORT = 18443
+
+# Stopping the updater drops its pending long poll, which aiohttp reports as an error
+logging.getLogger('aiohttp.server').setLevel(logging.CRITICAL)
+
+class FakeBotAPI:
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.updates = []
+        self.arrived = asyncio.Event()
+        self.webhook = None
+        self.session = None
+        self.web = web.Application()
+        self.web.router.add_post('/bot{token}/{method}', self.handle)
+    
+    async def reply(self, result):
+        await asyncio.sleep(self.rtt / 2)
+        return web.json_response({'ok': True, 'result': result})
+    
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if method == 'getMe':
+            return await self.reply({'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'})
+        if method == 'setWebhook':
+            self.webhook = (params['url'], params['secret_token'])
+            return await self.reply(True)
+        if method == 'deleteWebhook':
+            self.webhook = None
+            return await self.reply(True)
+        if method == 'getUpdates':
+            await asyncio.sleep(self.rtt / 2)
+            offset = int(params.get('offset') or 0)
+            deadline = time.monotonic() + float(params.get('timeout') or 0)
+            while True:
+                pending = [u for u in self.updates if u['update_id'] >= offset]
+                if pending or time.monotonic() >= deadline:
+                    await asyncio.sleep(self.rtt / 2)
+                    return web.json_response({'ok': True, 'result': pending})
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    pass
+        return await self.reply(True)
+    
+    async def push(self, update):
+        if self.webhook:
+            url, secret = self.webhook
+            await asyncio.sleep(self.rtt / 2)
+            async with self.session.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': secret}):
+                pass
+        else:
+            self.updates.append(update)
+            self.arrived.set()
+
+def make_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'User'},
+            'text': str(time.perf_counter())
+        }
+    }
+
+async def run(mode, updates, burst, spacing, gap, rtt):
+    api = FakeBotAPI(rtt)
+    runner = web.AppRunner(api.web, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', API_PORT).start()
+    api.session = ClientSession()
+    
+    latencies = []
+    done = asyncio.Event()
+    
+    async def handler(update, context):
+        latencies.append(time.perf_counter() - float(update.message.text))
+        if len(latencies) == updates:
+            done.set()
+    
+    app = Application.builder().token(TOKEN).base_url(f'http://127.0.0.1:{API_PORT}/bot').build()
+    app.add_handler(MessageHandler(filters.TEXT, handler))
+    
+    ingress = None
+    listener = None
+    if mode == 'webhook':
+        server = web.Application()
+        ingress = WebhookIngress(server, f'http://127.0.0.1:{WEBHOOK_PORT}')
+        listener = web.AppRunner(server, access_log=None)
+        await listener.setup()
+        await web.TCPSite(listener, '127.0.0.1', WEBHOOK_PORT).start()
+    
+    await app.initialize()
+    await start_updates(app, ingress)
+    await app.start()
+    
+    for i in range(updates):
+        await asyncio.sleep(gap if i % burst == 0 else spacing)
+        asyncio.create_task(api.push(make_update(i + 1)))
+    await asyncio.wait_for(done.wait(), 60)
+    
+    await stop_updates(app, ingress)
+    await app.stop()
+    await app.shutdown()
+    if listener:
+        await listener.cleanup()
+    await api.session.close()
+    await runner.cleanup()
+    
+    latencies.sort()
+    return {
+        'mode': mode,
+        'mean_ms': sum(latencies) / updates * 1000,
+        'p50_ms': latencies[updates // 2] * 1000,
+        'p99_ms': latencies[int(updates * 0.99) - 1] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--burst', type=int, default=5, help="updates per burst")
+    parser.add_argument('--spacing', type=float, default=0.01, help="seconds between updates in a burst")
+    parser.add_argument('--gap', type=float, default=0.2, help="idle seconds between bursts")
+    parser.add_argument('--rtt', type=float, default=0.05, help="simulated Bot API round trip in seconds")
+    args = parser.parse_args()
+    
+    print(f"{args.updates} updates in bursts of {args.burst} ({args.spacing * 1000:.0f} ms apart), "
+          f"{args.gap * 1000:.0f} ms idle between bursts, "
+          f"{args.rtt * 1000:.0f} ms round trip\n")
+    for mode in ('polling', 'webhook'):
+        r = asyncio.run(run(mode, args.updates, args.burst, args.spacing, args.gap, args.rtt))
+        print(f"{r['mode']:>7}: mean {r['mean_ms']:.1f} ms, p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms")
+
+if __name__ == '__main__':
+    main()
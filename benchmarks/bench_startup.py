@@ -0,0 +1,150 @@
+"""Compare store startup, snapshot size and save time for the json and msgpack snapshot formats.
+
+Builds a synthetic store once: --users users (a few banned, some pending
+payments) and a message map with --mappings entries. Each format is then
+loaded by Database() in a fresh subprocess, so the peak RSS figure covers
+that load only.
+
+    python benchmarks/bench_startup.py --users 500000 --mappings 5000000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def build_dataset(users, mappings):
+    rng = random.Random(1)
+    first = ['Alice', 'Rahul', 'Priya', 'Amit', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Bob', 'Carol']
+    data = {
+        'users': {},
+        'banned': [],
+        'pending_payments': {},
+        'payment_seq': 0,
+        'broadcast_jobs': {},
+        'broadcast_seq': 0,
+        'cloned_bots': {},
+        'paid_batches_text': 'No batches available yet.',
+        'greetings': ["✅ Message sent!"]
+    }
+    for uid in range(1, users + 1):
+        name = f"{rng.choice(first)} {uid}"
+        data['users'][str(uid)] = {
+            'id': uid,
+            'username': f"user{uid}" if rng.random() < 0.7 else None,
+            'name': name,
+            'joined': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00.{uid % 1000000:06d}",
+            'is_active': True
+        }
+    data['banned'] = rng.sample(range(1, users + 1), users // 100)
+    for pid in range(1, 201):
+        data['pending_payments'][str(pid)] = {
+            'id': pid, 'user_id': pid, 'plan_days': 7, 'plan_price': 12,
+            'screenshot': 'x' * 80, 'time': '2024-06-01T12:00:00', 'status': 'pending'
+        }
+    data['payment_seq'] = 200
+    data['stats'] = {
+        'total': users, 'active': users, 'banned': len(data['banned']),
+        'pending_payments': 200, 'active_clones': 0
+    }
+    return data
+
+def build_message_map(path, mappings, users):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS message_map "
+        "(owner_msg_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, ts INTEGER NOT NULL)"
+    )
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            "INSERT INTO message_map VALUES (?, ?, ?)",
+            ((mid, mid % users + 1, now) for mid in range(1, mappings + 1))
+        )
+        conn.execute("CREATE INDEX message_map_ts ON message_map(ts)")
+    conn.close()
+
+def peak_rss_mb():
+    # VmHWM starts over at exec; ru_maxrss would carry the parent's peak into the child
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def child(directory, fmt):
+    # Runs in its own process: load the store, save it once, report
+    os.environ['DB_SNAPSHOT_FORMAT'] = fmt
+    os.environ['DB_BACKUP_KEEP'] = '0'
+    os.chdir(directory)
+    from database import Database
+    
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    db = Database('data.json')
+    load = time.perf_counter() - started
+    peak = peak_rss_mb()
+    
+    started = time.perf_counter()
+    db.save()
+    save = time.perf_counter() - started
+    
+    print(json.dumps({
+        'load_s': load,
+        'save_s': save,
+        'peak_mb': peak - baseline,
+        'users': db.get_stats()['total'],
+        'mappings': len(db.message_map)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500000)
+    parser.add_argument('--mappings', type=int, default=5000000)
+    parser.add_argument('--child', nargs=2, metavar=('DIR', 'FORMAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child(*args.child)
+        return
+    
+    from snapshots import encode, finish, snapshot_path
+    
+    work = tempfile.mkdtemp(prefix='bench_startup_')
+    print(f"Building {args.users} users and {args.mappings} message mappings in {work}")
+    data = build_dataset(args.users, args.mappings)
+    build_message_map(os.path.join(work, 'messages.db'), args.mappings, args.users)
+    
+    results = {}
+    for fmt in ('json', 'msgpack'):
+        directory = os.path.join(work, fmt)
+        os.makedirs(directory)
+        path = snapshot_path(os.path.join(directory, 'data.json'), fmt)
+        with open(path, 'wb') as f:
+            f.write(finish(encode(data, fmt)))
+        shutil.copy(os.path.join(work, 'messages.db'), os.path.join(directory, 'data_messages.db'))
+        
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', directory, fmt],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[fmt] = json.loads(out.strip().splitlines()[-1])
+        results[fmt]['size_mb'] = os.path.getsize(path) / 1e6
+    
+    print()
+    for fmt, r in results.items():
+        print(f"{fmt:>8}: {r['size_mb']:.1f} MB on disk, load {r['load_s']:.2f} s, "
+              f"save {r['save_s']:.2f} s, peak +{r['peak_mb']:.0f} MB RSS "
+              f"({r['users']} users, {r['mappings']} mappings)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Local stand-in for the Bot API, for load tests that must not touch Telegram.
+
+Serves /bot<token>/<method> on 127.0.0.1. getUpdates long-polls a queue that
+the test fills with push(). The send methods return well-formed Messages with
+increasing message ids, and every other method answers True. Each call waits
+rtt seconds, plus up to jitter more. A fraction of calls gets a 429 with
+retry_after instead of an answer, the way Telegram reports a flood wait.
+
+    api = FakeBotAPI(rtt=0.05, flood_rate=0.01)
+    await api.start(18090)
+    app = Application.builder().token(TOKEN).base_url(api.base_url).build()
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+# Methods that answer with the Message they created
+SEND_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument', 'sendAudio', 'sendVoice',
+    'sendAnimation', 'sendSticker', 'sendVideoNote', 'sendLocation', 'sendContact', 'forwardMessage'
+}
+
+# Set-up and polling calls, left out of the per-update call counts
+CONTROL_METHODS = {'getMe', 'getUpdates', 'deleteWebhook', 'setWebhook', 'getWebhookInfo', 'setMyCommands'}
+
+class FakeBotAPI:
+    def __init__(self, rtt=0.05, jitter=0.0, flood_rate=0.0, retry_after=1, seed=1):
+        self.rtt = rtt
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.next_id = 0
+        # update_id -> when getUpdates handed it to the bot
+        self.delivered = {}
+        # (chat_id, message_id) of everything sent, in order
+        self.sent = []
+        self.calls = Counter()
+        self.floods = Counter()
+        self.pending = deque()
+        self.arrived = asyncio.Event()
+        self.runner = None
+        self.base_url = None
+        self.web = web.Application()
+        self.web.router.add_post('/bot{token}/{method}', self.handle)
+    
+    async def start(self, port):
+        self.runner = web.AppRunner(self.web, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', port).start()
+        self.base_url = f'http://127.0.0.1:{port}/bot'
+    
+    async def stop(self):
+        await self.runner.cleanup()
+    
+    def push(self, update):
+        self.pending.append(update)
+        self.arrived.set()
+    
+    def message_id(self):
+        self.next_id += 1
+        return self.next_id
+    
+    def message(self, chat_id, **fields):
+        message = {
+            'message_id': self.message_id(),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER,
+            **fields
+        }
+        self.sent.append((int(chat_id), message['message_id']))
+        return message
+    
+    def api_calls(self):
+        # Calls the handlers made, without polling and set-up
+        return sum(n for method, n in self.calls.items() if method not in CONTROL_METHODS)
+    
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(params)})
+        
+        await asyncio.sleep(self.rtt + self.rng.random() * self.jitter)
+        if method not in CONTROL_METHODS and self.rng.random() < self.flood_rate:
+            self.floods[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after}
+            }, status=429)
+        return web.json_response({'ok': True, 'result': self.result(method, params)})
+    
+    def result(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'copyMessage':
+            self.sent.append((int(params['chat_id']), self.message_id()))
+            return {'message_id': self.next_id}
+        if method == 'sendMediaGroup':
+            media = json.loads(params['media'])
+            return [self.message(params['chat_id'], media_group_id=str(self.next_id)) for _ in media]
+        if method in SEND_METHODS:
+            text = params.get('text')
+            return self.message(params['chat_id'], **({'text': text} if text else {}))
+        if method in ('editMessageText', 'editMessageCaption') and 'chat_id' in params:
+            return {
+                'message_id': int(params['message_id']),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': params.get('text') or params.get('caption') or ''
+            }
+        return True
+    
+    async def get_updates(self, params):
+        # Confirmed updates (below offset) are dropped, the rest go out up to limit at a time
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        while self.pending and self.pending[0]['update_id'] < offset:
+            self.pending.popleft()
+        while not self.pending and time.monotonic() < deadline:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.sleep(self.rtt)
+        batch = [self.pending[i] for i in range(min(limit, len(self.pending)))]
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered.setdefault(update['update_id'], now)
+        return batch
@@ -1,5 +1,7 @@
 import os
 import logging
+from functools import partial
+
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -7,37 +9,34 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 
-from database import db
+from albums import AlbumCollector, input_media, media_item
+from database import db, get_db
+from broadcast import resume_broadcasts, stop_broadcasts
+from clones import CloneRuntime
+from flood import FloodControl
+from health import HealthServer
+from metrics import Gauge, timed
+from outbound import OutboundScheduler
+from router import router
+from ingress import UPDATE_MODE, ChatOrderedProcessor, WebhookIngress, run_webhook
+# Importing the handler modules registers their callback routes
 from user_handlers import (
+    ForwardQueue,
     user_panel,
     handle_user_message,
-    user_send_callback,
-    paid_batches_callback,
-    clone_bot_callback,
-    plan_selected,
-    handle_payment_screenshot,
-    my_clone_callback,
-    user_help_callback,
-    cancel_payment_callback
+    handle_payment_screenshot
 )
 from owner_handlers import (
     owner_panel,
-    owner_stats_callback,
-    owner_active_callback,
-    owner_banned_callback,
-    user_info_callback,
-    ban_user_callback,
-    unban_user_callback,
-    owner_ban_callback,
-    owner_unban_callback,
+    find_command,
     owner_broadcast_callback,
     receive_broadcast,
     edit_batches_callback,
     receive_batches_text,
-    owner_payments_callback,
     cancel_conversation,
     BROADCAST_MSG,
     EDIT_BATCHES
@@ -53,26 +52,38 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 OWNER_ID = int(os.getenv('OWNER_ID'))
 OWNER_NAME = os.getenv('OWNER_NAME', 'Sam')
 
+def dataset_sizes():
+    stats = db.get_stats()
+    return {
+        ('users',): stats['total'],
+        ('message_map',): len(db.message_map),
+        ('pending_payments',): stats['pending_payments'],
+        ('clones',): stats['active_clones']
+    }
+
+# Counting the message map touches disk, so refresh sizes at most every 30s
+Gauge('bot_dataset_size', "Records in the main bot's store", ('dataset',), collect=dataset_sizes, every=30)
+
 async def start(update: Update, context):
     user_id = update.effective_user.id
     
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
+    owner_id = context.bot_data['OWNER_ID']
     
-    if user_id == OWNER_ID:
+    if user_id == owner_id:
         await owner_panel(update, context)
     else:
         await user_panel(update, context)
 
+@timed('handle_text_message')
 async def handle_text_message(update: Update, context):
     user_id = update.effective_user.id
     msg = update.message
     
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
+    owner_id = context.bot_data['OWNER_ID']
+    db = get_db(context)
     
     # Owner actions
-    if user_id == OWNER_ID:
+    if user_id == owner_id:
         # Ban action
         if 'awaiting_ban' in context.user_data and context.user_data['awaiting_ban']:
             try:
@@ -102,7 +113,8 @@ async def handle_text_message(update: Update, context):
         # Check for bot token after approval
         if msg.text and msg.text.count(':') == 1 and len(msg.text) > 40:
             # Looks like a bot token
-            for key, value in context.bot_data.items():
+            # Snapshot: approvals for other users may add keys while we await get_me
+            for key, value in list(context.bot_data.items()):
                 if key.startswith('awaiting_token_'):
                     user_id_str = key.split('_')[2]
                     payment = value
@@ -113,8 +125,11 @@ async def handle_text_message(update: Update, context):
                         test_bot = Bot(token=msg.text)
                         bot_info = await test_bot.get_me()
                         
-                        # Add clone bot
-                        db.add_cloned_bot(int(user_id_str), msg.text, payment['plan_days'])
+                        # Add clone bot and bring it up right away
+                        clone = db.add_cloned_bot(int(user_id_str), msg.text, payment['plan_days'])
+                        clones = context.bot_data.get('clones')
+                        if clones:
+                            await clones.add_clone(int(user_id_str), clone)
                         
                         await msg.reply_text(
                             f"✅ Clone Bot Created!\n\n"
@@ -155,28 +170,27 @@ async def handle_text_message(update: Update, context):
     # Regular user message
     await handle_user_message(update, context)
 
+@timed('handle_media_message')
 async def handle_media_message(update: Update, context):
     user_id = update.effective_user.id
     msg = update.message
     
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
+    owner_id = context.bot_data['OWNER_ID']
+    db = get_db(context)
+    
+    # Later items of an album someone is already sending go wherever its first item went
+    if context.bot_data['albums'].join(msg):
+        return
     
     # Owner replying with media
-    if user_id == OWNER_ID and msg.reply_to_message:
+    if user_id == owner_id and msg.reply_to_message:
         target_user = db.get_user_from_msg(msg.reply_to_message.message_id)
+        if target_user and msg.media_group_id:
+            context.bot_data['albums'].start(msg, partial(send_album_reply, context, target_user))
+            return
         if target_user:
             try:
-                if msg.photo:
-                    await context.bot.send_photo(target_user, msg.photo[-1].file_id, caption=msg.caption or "")
-                elif msg.video:
-                    await context.bot.send_video(target_user, msg.video.file_id, caption=msg.caption or "")
-                elif msg.document:
-                    await context.bot.send_document(target_user, msg.document.file_id, caption=msg.caption or "")
-                elif msg.voice:
-                    await context.bot.send_voice(target_user, msg.voice.file_id)
-                elif msg.audio:
-                    await context.bot.send_audio(target_user, msg.audio.file_id, caption=msg.caption or "")
+                await context.bot.copy_message(target_user, msg.chat_id, msg.message_id)
                 
                 await msg.reply_text(f"✅ Media sent to {target_user}!")
                 logger.info(f"📎 Media sent to {target_user}")
@@ -193,105 +207,113 @@ async def handle_media_message(update: Update, context):
     # Regular user media
     await handle_user_message(update, context)
 
-async def handle_callback(update: Update, context):
+async def send_album_reply(context, target_user, messages):
+    owner_chat = messages[0].chat_id
+    try:
+        await context.bot.send_media_group(target_user, [input_media(media_item(m)) for m in messages])
+        await context.bot.send_message(owner_chat, f"✅ Album sent to {target_user}!")
+        logger.info(f"🖼 Album of {len(messages)} sent to {target_user}")
+    except Exception as e:
+        await context.bot.send_message(owner_chat, f"❌ Failed: {e}")
+
+@router.route('approve', int, int)
+async def approve_payment_callback(update: Update, context, payment_id, user_id):
     query = update.callback_query
-    data = query.data
-    
-    context.bot_data['OWNER_ID'] = OWNER_ID
-    context.bot_data['OWNER_NAME'] = OWNER_NAME
-    
-    # User callbacks
-    if data == "user_send":
-        await user_send_callback(update, context)
-    elif data == "paid_batches":
-        await paid_batches_callback(update, context)
-    elif data == "clone_bot":
-        await clone_bot_callback(update, context)
-    elif data.startswith("plan_"):
-        await plan_selected(update, context)
-    elif data == "my_clone":
-        await my_clone_callback(update, context)
-    elif data == "user_help":
-        await user_help_callback(update, context)
-    elif data == "cancel_payment":
-        await cancel_payment_callback(update, context)
+    db = get_db(context)
     
-    # Owner callbacks
-    elif data == "owner_stats":
-        await owner_stats_callback(update, context)
-    elif data == "owner_active":
-        await owner_active_callback(update, context)
-    elif data == "owner_banned":
-        await owner_banned_callback(update, context)
-    elif data.startswith("userinfo_"):
-        await user_info_callback(update, context)
-    elif data.startswith("ban_") and not data.startswith("ban_user"):
-        await ban_user_callback(update, context)
-    elif data.startswith("unban_") and not data.startswith("unban_user"):
-        await unban_user_callback(update, context)
-    elif data == "owner_ban":
-        await owner_ban_callback(update, context)
-    elif data == "owner_unban":
-        await owner_unban_callback(update, context)
-    elif data == "owner_broadcast":
-        await owner_broadcast_callback(update, context)
-    elif data == "edit_batches":
-        await edit_batches_callback(update, context)
-    elif data == "owner_payments":
-        await owner_payments_callback(update, context)
+    payment = db.approve_payment(payment_id)
     
-    # Payment actions
-    elif data.startswith("approve_"):
-        parts = data.split("_")
-        payment_id = int(parts[1])
-        user_id = int(parts[2])
+    if payment:
+        await query.answer("✅ Approved!", show_alert=True)
+        await query.message.edit_caption(
+            caption=query.message.caption + "\n\n✅ APPROVED - Awaiting bot token"
+        )
         
-        payment = db.approve_payment(payment_id)
+        await context.bot.send_message(
+            user_id,
+            "🎉 Payment Approved!\n\n"
+            "Now send your bot token:\n"
+            "1. Go to @BotFather\n"
+            "2. Create new bot (/newbot)\n"
+            "3. Copy bot token\n"
+            "4. Send it here"
+        )
         
-        if payment:
-            await query.answer("✅ Approved!", show_alert=True)
-            await query.message.edit_caption(
-                caption=query.message.caption + "\n\n✅ APPROVED - Awaiting bot token"
-            )
-            
-            await context.bot.send_message(
-                user_id,
-                "🎉 Payment Approved!\n\n"
-                "Now send your bot token:\n"
-                "1. Go to @BotFather\n"
-                "2. Create new bot (/newbot)\n"
-                "3. Copy bot token\n"
-                "4. Send it here"
-            )
-            
-            context.bot_data[f'awaiting_token_{user_id}'] = payment
-            logger.info(f"✅ Payment {payment_id} approved")
+        context.bot_data[f'awaiting_token_{user_id}'] = payment
+        logger.info(f"✅ Payment {payment_id} approved")
+    else:
+        await query.answer("Payment already processed.", show_alert=True)
+
+@router.route('reject', int, int)
+async def reject_payment_callback(update: Update, context, payment_id, user_id):
+    query = update.callback_query
+    db = get_db(context)
     
-    elif data.startswith("reject_"):
-        parts = data.split("_")
-        payment_id = int(parts[1])
-        user_id = int(parts[2])
+    if db.reject_payment(payment_id):
+        await query.answer("❌ Rejected!", show_alert=True)
+        await query.message.edit_caption(
+            caption=query.message.caption + "\n\n❌ REJECTED"
+        )
+        
+        await context.bot.send_message(
+            user_id,
+            "❌ Payment Rejected\n\n"
+            "Please contact admin for details."
+        )
         
-        if db.reject_payment(payment_id):
-            await query.answer("❌ Rejected!", show_alert=True)
-            await query.message.edit_caption(
-                caption=query.message.caption + "\n\n❌ REJECTED"
-            )
-            
-            await context.bot.send_message(
-                user_id,
-                "❌ Payment Rejected\n\n"
-                "Please contact admin for details."
-            )
-            
-            logger.info(f"❌ Payment {payment_id} rejected")
+        logger.info(f"❌ Payment {payment_id} rejected")
+    else:
+        await query.answer("Payment already processed.", show_alert=True)
 
-def main():
-    if not BOT_TOKEN or not OWNER_ID:
-        logger.error("❌ Missing BOT_TOKEN or OWNER_ID!")
-        return
+async def post_init(app: Application):
+    # Listen before anything registers a webhook that points at us
+    await app.bot_data['http'].start(app)
+    db.start_writer()
+    resume_broadcasts(app)
+    await app.bot_data['clones'].start_all(app.job_queue)
+
+async def post_stop(app: Application):
+    # Clones do both of these in CloneRuntime.stop_clone
+    await stop_broadcasts(app)
+    await app.bot_data['forwards'].stop()
+
+async def post_shutdown(app: Application):
+    await app.bot_data['clones'].stop_all()
+    
+    # Flush anything the write-behind task has not persisted yet
+    await db.close()
+    logger.info(f"💾 Database closed: {db.flush_stats}")
+    await app.bot_data['http'].stop()
+
+def build_application(token, owner_id, owner_name, store, request=None, is_clone=False, base_url=None, **hooks):
+    # Every send goes through one scheduler per bot: priorities plus global and per-chat limits
+    builder = Application.builder().token(token).rate_limiter(OutboundScheduler())
+    if base_url:
+        # A self-hosted Bot API server, or the load test's stand-in
+        builder = builder.base_url(base_url)
+    # Different chats are handled concurrently, each chat's updates strictly in order
+    builder = builder.concurrent_updates(ChatOrderedProcessor())
+    if request:
+        builder = builder.request(request)
+    if is_clone:
+        # Clone expiry is scheduled on the main bot's JobQueue, clones don't need their own
+        builder = builder.job_queue(None)
+    if hooks.get('post_init'):
+        builder = builder.post_init(hooks['post_init'])
+    if hooks.get('post_stop'):
+        builder = builder.post_stop(hooks['post_stop'])
+    if hooks.get('post_shutdown'):
+        builder = builder.post_shutdown(hooks['post_shutdown'])
+    app = builder.build()
     
-    app = Application.builder().token(BOT_TOKEN).build()
+    app.bot_data['OWNER_ID'] = owner_id
+    app.bot_data['OWNER_NAME'] = owner_name
+    app.bot_data['IS_CLONE'] = is_clone
+    app.bot_data['db'] = store
+    app.bot_data['flood'] = FloodControl()
+    app.bot_data['albums'] = AlbumCollector(app)
+    app.update_processor.hold = app.bot_data['albums'].hold
+    app.bot_data['forwards'] = ForwardQueue(app)
     
     # Broadcast conversation
     broadcast_conv = ConversationHandler(
@@ -313,20 +335,53 @@ def main():
     
     # Add handlers
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("find", find_command, filters.User(owner_id)))
     app.add_handler(broadcast_conv)
     app.add_handler(batches_conv)
-    app.add_handler(CallbackQueryHandler(handle_callback))
+    app.add_handler(router.handler())
     app.add_handler(MessageHandler(
-        filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.VOICE | filters.AUDIO | filters.VIDEO_NOTE,
+        filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.VOICE | filters.AUDIO | filters.VIDEO_NOTE
+        | filters.Sticker.ALL | filters.ANIMATION | filters.LOCATION | filters.CONTACT,
         handle_media_message
     ))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
+    return app
+
+def main():
+    if not BOT_TOKEN or not OWNER_ID:
+        logger.error("❌ Missing BOT_TOKEN or OWNER_ID!")
+        return
+    
+    # Health endpoints and, in webhook mode, updates for the main bot and all clones share one listener
+    http = HealthServer()
+    ingress = WebhookIngress(http.web) if UPDATE_MODE == 'webhook' else None
+    
+    # Clone bots run as extra Applications on this event loop and share its connection pool
+    clones = CloneRuntime(build_application, db, ingress)
+    app = build_application(
+        BOT_TOKEN,
+        OWNER_ID,
+        OWNER_NAME,
+        db,
+        request=clones.request,
+        post_init=post_init,
+        post_stop=post_stop,
+        post_shutdown=post_shutdown
+    )
+    app.bot_data['clones'] = clones
+    app.bot_data['http'] = http
+    app.add_handler(TypeHandler(Update, http.touch), group=-1)
+    
     logger.info("🚀 Bot starting...")
     logger.info(f"👑 Owner: {OWNER_ID}")
     logger.info(f"📝 Name: {OWNER_NAME}")
+    logger.info(f"📡 Updates: {UPDATE_MODE}")
     
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if ingress:
+        run_webhook(app, ingress)
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from albums import input_media
+from outbound import BROADCAST
+
+logger = logging.getLogger(__name__)
+
+# Pacing comes from the bot's OutboundScheduler; broadcasts queue behind every other send
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '20'))
+BROADCAST_RETRIES = 3
+PROGRESS_INTERVAL = 5.0
+
+class Broadcast:
+    def __init__(self, bot, job, db, running):
+        self.bot = bot
+        self.job = job
+        self.db = db
+        self.running = running
+        self.targets = job['targets']
+        self.cursor = job['cursor']
+        self.done_ahead = set(job['done_ahead'])
+        self.counts = dict(job['counts'])
+        # Sends recorded after the job's last checkpoint; the ones it already covers are skipped
+        for index, outcome in db.get_broadcast_deliveries(job['id']):
+            if index >= self.cursor and index not in self.done_ahead:
+                self.advance(index, outcome)
+        # Album broadcasts carry their items; jobs from before albums have no 'media' key
+        self.media = [input_media(item) for item in job.get('media') or ()]
+        self.resumed_at = self.cursor + len(self.done_ahead)
+        self.stopped = None
+        self.started = None
+        self.task = None
+    
+    async def send(self, chat_id):
+        attempt = 0
+        while True:
+            if self.stopped:
+                return None
+            try:
+                if self.media:
+                    await self.bot.send_media_group(chat_id, self.media, rate_limit_args=BROADCAST)
+                else:
+                    # copy_message handles every content type in one call
+                    await self.bot.copy_message(
+                        chat_id, self.job['from_chat_id'], self.job['message_id'], rate_limit_args=BROADCAST
+                    )
+                return 'sent'
+            except RetryAfter:
+                # The scheduler already retried and paused the whole bot; queue up again
+                pass
+            except Forbidden as e:
+                return 'deactivated' if 'deactivated' in e.message.lower() else 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in e.message.lower():
+                    return 'deactivated'
+                logger.warning(f"⚠️ Broadcast to {chat_id} failed: {e}")
+                return 'failed'
+            except NetworkError as e:
+                # TimedOut is a NetworkError too; back off and try again
+                attempt += 1
+                if attempt >= BROADCAST_RETRIES:
+                    logger.warning(f"⚠️ Broadcast to {chat_id} gave up: {e}")
+                    return 'failed'
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.warning(f"⚠️ Broadcast to {chat_id} failed: {e}")
+                return 'failed'
+    
+    def advance(self, index, outcome):
+        self.counts[outcome] += 1
+        
+        # Workers finish out of order: cursor is the first undelivered index,
+        # done_ahead holds the finished ones past it
+        self.done_ahead.add(index)
+        while self.cursor in self.done_ahead:
+            self.done_ahead.discard(self.cursor)
+            self.cursor += 1
+    
+    def complete(self, index, outcome):
+        # Recorded before anything else, so a resume skips exactly the targets already handled
+        self.db.record_broadcast_delivery(self.job['id'], index, outcome)
+        self.advance(index, outcome)
+    
+    def checkpoint(self, **fields):
+        self.db.update_broadcast_job(
+            self.job['id'],
+            cursor=self.cursor,
+            done_ahead=sorted(self.done_ahead),
+            counts=dict(self.counts),
+            **fields
+        )
+    
+    def stop(self, status):
+        # Workers finish the send they are on and exit
+        self.stopped = status
+    
+    async def worker(self, queue):
+        while not self.stopped:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            outcome = await self.send(self.targets[index])
+            if outcome:
+                self.complete(index, outcome)
+    
+    def progress_text(self, status):
+        c = self.counts
+        handled = self.cursor + len(self.done_ahead)
+        elapsed = time.monotonic() - self.started
+        heads = {
+            'done': "✅ Broadcast Complete!",
+            'paused': "⏸ Broadcast Paused",
+            'cancelled': "✖️ Broadcast Cancelled",
+            'running': "📤 Broadcasting..."
+        }
+        return (
+            f"{heads[status]} #{self.job['id']} {handled}/{len(self.targets)}\n\n"
+            f"✅ Sent: {c['sent']}\n"
+            f"🚫 Blocked: {c['blocked']}\n"
+            f"👻 Deactivated: {c['deactivated']}\n"
+            f"❌ Failed: {c['failed']}\n"
+            f"⚡️ {(handled - self.resumed_at) / elapsed if elapsed else 0:.1f} msg/s"
+        )
+    
+    async def report(self, status='running'):
+        if not self.job['status_message_id']:
+            return
+        try:
+            await self.bot.edit_message_text(
+                self.progress_text(status),
+                chat_id=self.job['from_chat_id'],
+                message_id=self.job['status_message_id'],
+                rate_limit_args=BROADCAST
+            )
+        except BadRequest as e:
+            if 'not modified' not in e.message.lower():
+                logger.warning(f"⚠️ Broadcast status update failed: {e}")
+        except NetworkError:
+            pass
+    
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await self.report()
+    
+    async def run(self):
+        self.started = time.monotonic()
+        queue = asyncio.Queue()
+        for index in range(self.cursor, len(self.targets)):
+            if index not in self.done_ahead:
+                queue.put_nowait(index)
+        
+        reporter = asyncio.create_task(self.reporter())
+        try:
+            workers = min(BROADCAST_WORKERS, queue.qsize()) or 1
+            await asyncio.gather(*(self.worker(queue) for _ in range(workers)))
+        finally:
+            reporter.cancel()
+            self.running.pop(self.job['id'], None)
+        
+        status = self.stopped or 'done'
+        if status == 'done':
+            # Nothing left to resume, drop the target snapshot
+            self.checkpoint(status=status, targets=[])
+        else:
+            self.checkpoint(status=status)
+        if status in ('done', 'cancelled'):
+            self.db.clear_broadcast_deliveries(self.job['id'])
+        
+        await self.report(status)
+        logger.info(f"📢 Broadcast #{self.job['id']} {status}: {self.counts}")
+        return self.counts
+
+def running_broadcasts(application):
+    # job id -> Broadcast for every job this bot is running right now
+    return application.bot_data.setdefault('broadcasts', {})
+
+def log_failure(task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"❌ Broadcast failed: {task.exception()!r}")
+
+def start_broadcast(application, job):
+    # The task is ours, not the Application's: stop() would wait for every running
+    # broadcast to finish, stop_broadcasts() ends them at a checkpoint instead
+    running = running_broadcasts(application)
+    broadcast = Broadcast(application.bot, job, application.bot_data['db'], running)
+    running[job['id']] = broadcast
+    broadcast.task = asyncio.create_task(broadcast.run())
+    broadcast.task.add_done_callback(log_failure)
+    return broadcast
+
+async def stop_broadcasts(application):
+    # Before the bot stops: every running job finishes the sends it is on, checkpoints
+    # and stays 'running', so the next start resumes it from there
+    broadcasts = list(running_broadcasts(application).values())
+    for broadcast in broadcasts:
+        broadcast.stop('running')
+    await asyncio.gather(*(broadcast.task for broadcast in broadcasts), return_exceptions=True)
+
+def resume_broadcasts(application):
+    db = application.bot_data['db']
+    for job in db.get_broadcast_jobs():
+        if job['status'] == 'running' and job['id'] not in running_broadcasts(application):
+            logger.info(f"📢 Resuming broadcast #{job['id']} at {job['cursor']}/{len(job['targets'])}")
+            start_broadcast(application, job)
+
+def pause_broadcast(application, job_id):
+    db = application.bot_data['db']
+    running = running_broadcasts(application)
+    job = db.get_broadcast_job(job_id)
+    if not job or job['status'] != 'running':
+        return False
+    db.update_broadcast_job(job_id, status='paused')
+    if job_id in running:
+        running[job_id].stop('paused')
+    return True
+
+def unpause_broadcast(application, job_id):
+    db = application.bot_data['db']
+    job = db.get_broadcast_job(job_id)
+    if not job or job['status'] != 'paused' or job_id in running_broadcasts(application):
+        return False
+    db.update_broadcast_job(job_id, status='running')
+    start_broadcast(application, db.get_broadcast_job(job_id))
+    return True
+
+def cancel_broadcast(application, job_id):
+    db = application.bot_data['db']
+    running = running_broadcasts(application)
+    job = db.get_broadcast_job(job_id)
+    if not job or job['status'] not in ('running', 'paused'):
+        return False
+    db.update_broadcast_job(job_id, status='cancelled', targets=[])
+    if job_id in running:
+        running[job_id].stop('cancelled')
+    else:
+        db.clear_broadcast_deliveries(job_id)
+    return True
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+from broadcast import resume_broadcasts, stop_broadcasts
+from database import open_database
+from ingress import start_updates, stop_updates
+from metrics import API_ERRORS, API_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CLONES_DIR = os.getenv('CLONES_DIR', 'clones')
+CLONE_POOL_SIZE = int(os.getenv('CLONE_POOL_SIZE', '64'))
+
+# How long before expiry the clone owner gets a renewal reminder (seconds, 0 = never)
+CLONE_EXPIRY_NOTICE = int(os.getenv('CLONE_EXPIRY_NOTICE', str(24 * 3600)))
+
+class SharedRequest(HTTPXRequest):
+    # One connection pool for every bot in the process. Bots call shutdown()
+    # when they stop, so only the runtime is allowed to really close it.
+    async def shutdown(self):
+        pass
+    
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except TelegramError as e:
+            API_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            API_ERRORS.inc(api_method, str(code))
+        return code, payload
+    
+    async def close(self):
+        await super().shutdown()
+
+class ExpiryScheduler:
+    # Min-heap of (when, user_id, expires_at, kind) with one JobQueue job armed for the head.
+    # Renewals just push new entries; stale ones are recognised by expires_at when they pop.
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.heap = []
+        self.job_queue = None
+        self.job = None
+        self.armed_for = None
+    
+    def start(self, job_queue):
+        self.job_queue = job_queue
+        self.arm()
+    
+    def schedule(self, user_id, clone):
+        expires_at = clone['expires_at']
+        if CLONE_EXPIRY_NOTICE and not clone['notified']:
+            heapq.heappush(self.heap, (expires_at - CLONE_EXPIRY_NOTICE, user_id, expires_at, 'notice'))
+        heapq.heappush(self.heap, (expires_at, user_id, expires_at, 'expire'))
+        self.arm()
+    
+    def arm(self):
+        if not self.job_queue or not self.heap:
+            return
+        when = self.heap[0][0]
+        if self.job and self.armed_for <= when:
+            return
+        if self.job:
+            self.job.schedule_removal()
+        self.job = self.job_queue.run_once(self.fire, max(0, when - time.time()), name='clone_expiry')
+        self.armed_for = when
+    
+    async def fire(self, context):
+        self.job = None
+        try:
+            while self.heap and self.heap[0][0] <= time.time():
+                _, user_id, expires_at, kind = heapq.heappop(self.heap)
+                try:
+                    if kind == 'notice':
+                        await self.notify(context.bot, user_id, expires_at)
+                    else:
+                        await self.expire(context.bot, user_id, expires_at)
+                except TelegramError as e:
+                    logger.warning(f"⚠️ Clone {kind} for {user_id} failed: {e}")
+                except Exception as e:
+                    # One bad entry must not strand the rest of the heap
+                    logger.error(f"❌ Clone {kind} for {user_id} failed: {e!r}")
+        finally:
+            # job was cleared above, so without this nothing would ever fire again
+            self.arm()
+    
+    async def notify(self, bot, user_id, expires_at):
+        db = self.runtime.main_db
+        clone = db.get_cloned_bot(user_id)
+        if not clone or clone['expires_at'] != expires_at or clone['notified']:
+            return
+        db.mark_clone_notified(user_id)
+        hours = max(0, round((expires_at - time.time()) / 3600))
+        await bot.send_message(
+            user_id,
+            f"⏰ Your clone bot expires in {hours} hour(s).\n\n"
+            f"Buy a new plan to keep it running!"
+        )
+    
+    async def expire(self, bot, user_id, expires_at):
+        if not self.runtime.main_db.deactivate_clone(user_id, expires_at):
+            return
+        await self.runtime.stop_clone(user_id, forget=True)
+        logger.info(f"⌛ Clone for {user_id} expired")
+        await bot.send_message(
+            user_id,
+            "⌛ Your clone bot has expired.\n\n"
+            "Buy a new plan to bring it back!"
+        )
+
+class CloneRuntime:
+    def __init__(self, build_app, main_db, ingress=None):
+        self.build_app = build_app
+        self.main_db = main_db
+        self.ingress = ingress
+        self.request = SharedRequest(connection_pool_size=CLONE_POOL_SIZE)
+        self.apps = {}
+        self.expiry = ExpiryScheduler(self)
+    
+    async def start_clone(self, user_id):
+        clone = self.main_db.get_cloned_bot(user_id)
+        if not clone or user_id in self.apps:
+            return False
+        
+        owner = self.main_db.get_user(user_id)
+        store = open_database(os.path.join(CLONES_DIR, str(user_id)))
+        app = self.build_app(
+            clone['bot_token'],
+            user_id,
+            owner['name'] if owner else 'Owner',
+            store,
+            request=self.request,
+            is_clone=True
+        )
+        
+        # Claim the slot before awaiting so a second start can't race this one
+        self.apps[user_id] = app
+        try:
+            await app.initialize()
+            await start_updates(app, self.ingress)
+            await app.start()
+        except TelegramError as e:
+            logger.error(f"❌ Clone for {user_id} failed to start: {e}")
+            await self.stop_clone(user_id)
+            return False
+        
+        store.start_writer()
+        logger.info(f"🤖 Clone @{app.bot.username} started for {user_id}")
+        resume_broadcasts(app)
+        return True
+    
+    async def add_clone(self, user_id, clone):
+        self.expiry.schedule(user_id, clone)
+        app = self.apps.get(user_id)
+        if app and app.bot.token != clone['bot_token']:
+            # Renewed with another bot: the running one is no longer this user's clone
+            await self.stop_clone(user_id, forget=True)
+        return await self.start_clone(user_id)
+    
+    async def stop_clone(self, user_id, forget=False):
+        app = self.apps.pop(user_id, None)
+        if not app:
+            return False
+        
+        try:
+            await stop_updates(app, self.ingress, forget)
+        except TelegramError as e:
+            logger.warning(f"⚠️ Clone for {user_id} left its webhook behind: {e}")
+        if app.running:
+            await stop_broadcasts(app)
+            await app.stop()
+            await app.bot_data['forwards'].stop()
+        await app.shutdown()
+        await app.bot_data['db'].close()
+        logger.info(f"🤖 Clone for {user_id} stopped")
+        return True
+    
+    async def start_all(self, job_queue):
+        user_ids = []
+        for uid, clone in self.main_db.get_cloned_bots().items():
+            if clone['active']:
+                # Clones that lapsed while the bot was down are in the past and expire right away
+                self.expiry.schedule(int(uid), clone)
+                user_ids.append(int(uid))
+        self.expiry.start(job_queue)
+        
+        # Bring clones up concurrently, each start is a few Bot API round trips
+        results = await asyncio.gather(*(self.start_clone(uid) for uid in user_ids))
+        logger.info(f"🤖 {sum(results)} clone bot(s) running")
+    
+    async def stop_all(self):
+        await asyncio.gather(*(self.stop_clone(uid) for uid in list(self.apps)))
+        await self.request.close()
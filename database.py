@@ -1,86 +1,477 @@
+import asyncio
 import json
+import logging
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from types import MappingProxyType
+
+from message_map import MessageMap, SpillStore
+from metrics import SAVE_BYTES, SAVE_SECONDS
+from search_index import UserSearch
+from snapshots import SnapshotFile, encode as encode_snapshot, finish as finish_snapshot
+
+# json    - rewrite data.json on every mutation
+# journal - append mutations to data.json.journal, compact periodically
+# sqlite  - SQLiteDatabase in data.db, migrated from data.json on first start
+DB_BACKEND = os.getenv('DB_BACKEND', 'json')
+JOURNAL_COMPACT_EVERY = int(os.getenv('DB_JOURNAL_COMPACT_EVERY', '1000'))
+
+# Write-behind: coalesce mutations and persist them from a worker thread
+WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', '0') == '1'
+FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '1.0'))
+FLUSH_EVERY = int(os.getenv('DB_FLUSH_EVERY', '100'))
+
+logger = logging.getLogger(__name__)
+
+# Sort keys for paged user listings; the id breaks ties so every key is unique
+USER_ORDERS = {
+    'joined': lambda u: (u['joined'], u['id']),
+    'name': lambda u: ((u['name'] or '').lower(), u['id'])
+}
+
+DEFAULT_GREETINGS = [
+    "✅ Message sent!",
+    "✨ Message forwarded!",
+    "📨 Delivered successfully!",
+    "👍 Owner will see your message!",
+    "🎯 Message sent!",
+    "💬 On its way!",
+    "✉️ Sent to owner!",
+    "🚀 Delivered!",
+    "📬 Owner received!"
+]
 
 class Database:
-    def __init__(self):
-        self.file = 'data.json'
+    def __init__(self, file='data.json', backend=DB_BACKEND):
+        self.file = file
+        self.snapshot = SnapshotFile(file)
+        self.journal_file = file + '.journal'
+        self.archive_file = os.path.splitext(file)[0] + '_payments.jsonl'
+        self.message_map = MessageMap(SpillStore.open(os.path.splitext(file)[0] + '_messages.db'))
+        self.backend = backend
+        self.journal = None
+        self.journal_records = 0
+        
+        # Handlers run concurrently on one event loop, but no method here awaits, so every
+        # call (check-then-set included) is atomic to them. lock guards self.data against
+        # the writer thread serializing it mid-mutation, flush_lock keeps two flushes from
+        # interleaving their writes
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.pending = []
+        # Payments settled by pending commits, archived once those are on disk
+        self.settled = []
+        # Broadcast delivery logs: job id -> open file, and finished jobs whose logs go with the next flush
+        self.delivery_logs = {}
+        self.finished_broadcasts = []
+        self.writer = None
+        self.wakeup = None
+        self.flush_stats = {'commits': 0, 'mutations': 0, 'last_batch': 0, 'max_batch': 0}
+        
         self.load()
     
     def load(self):
-        if os.path.exists(self.file):
-            with open(self.file, 'r') as f:
-                self.data = json.load(f)
-        else:
+        self.data = self.snapshot.read()
+        if self.data is None:
             self.data = {
                 'users': {},
                 'banned': [],
-                'pending_payments': [],
+                'pending_payments': {},
+                'payment_seq': 0,
+                'broadcast_jobs': {},
+                'broadcast_seq': 0,
                 'cloned_bots': {},
-                'message_map': {},
                 'paid_batches_text': 'No batches available yet.',
-                'greetings': [
-                    "✅ Message sent!",
-                    "✨ Message forwarded!",
-                    "📨 Delivered successfully!",
-                    "👍 Owner will see your message!",
-                    "🎯 Message sent!",
-                    "💬 On its way!",
-                    "✉️ Sent to owner!",
-                    "🚀 Delivered!",
-                    "📬 Owner received!"
-                ]
+                'greetings': list(DEFAULT_GREETINGS)
             }
-            self.save()
+        
+        # Replay whatever was journaled since the last snapshot, then start fresh
+        self.data.setdefault('message_map', {})
+        self.data.setdefault('broadcast_jobs', {})
+        self.data.setdefault('broadcast_seq', 0)
+        replayed, torn = self.replay_journal()
+        
+        # Reply routing lives in the message map store, not in the snapshot
+        legacy = self.data.pop('message_map')
+        if legacy:
+            now = int(time.time())
+            self.message_map.spill.put_many((int(mid), uid, now) for mid, uid in legacy.items())
+        
+        migrated = self.migrate_payments()
+        migrated = self.migrate_clones() or migrated
+        
+        # A torn line must go too, or the next append would continue it and be lost with it
+        if replayed or torn or legacy or migrated or not self.snapshot.exists():
+            self.compact()
+        
+        self.rebuild_indexes()
+    
+    def migrate_payments(self):
+        # Older files kept every payment ever made in one list with len()-based ids
+        payments = self.data['pending_payments']
+        if not isinstance(payments, list):
+            return False
+        
+        self.data['payment_seq'] = max((p['id'] for p in payments), default=0)
+        self.data['pending_payments'] = {str(p['id']): p for p in payments if p['status'] == 'pending'}
+        self.archive_payments([p for p in payments if p['status'] != 'pending'])
+        return True
+    
+    def migrate_clones(self):
+        # Expiry used to be an ISO string parsed on every lookup, keep it as epoch seconds
+        migrated = False
+        for clone in self.data['cloned_bots'].values():
+            if 'expiry' in clone:
+                clone['expires_at'] = datetime.fromisoformat(clone.pop('expiry')).timestamp()
+                clone.setdefault('notified', False)
+                migrated = True
+        return migrated
+    
+    def archive_payments(self, payments):
+        if not payments:
+            return
+        with open(self.archive_file, 'a') as f:
+            f.writelines(json.dumps(p) + '\n' for p in payments)
+    
+    def rebuild_indexes(self):
+        # In-memory indexes over data['users'], kept in sync by the mutators below
+        self.banned = set(self.data['banned'])
+        self.active_users = {}
+        self.banned_users = {}
+        for k, v in self.data['users'].items():
+            if v.get('is_active', True):
+                self.active_users[k] = v
+            if int(k) in self.banned:
+                self.banned_users[k] = v
+        
+        # Built on the first /find instead of on every startup
+        self.user_search = UserSearch(self.search_entries)
+        
+        # Sorted key lists per (listing, order) so a page is a bisect and a slice,
+        # each sorted when its listing is first opened
+        self.user_index = {}
+        
+        # Running counters are persisted with every mutation; a mismatch means a bug or a hand-edited file
+        counted = self.recount()
+        stored = self.data.get('stats')
+        if stored != counted:
+            if stored is not None:
+                logger.warning(f"⚠️ Stats drifted, recounted {stored} -> {counted}")
+            self.commit(('set', ['stats'], counted))
+    
+    def recount(self):
+        return {
+            'total': len(self.data['users']),
+            'active': len(self.active_users),
+            'banned': len(self.banned_users),
+            'pending_payments': len(self.data['pending_payments']),
+            'active_clones': sum(1 for c in self.data['cloned_bots'].values() if c.get('active', False))
+        }
+    
+    def count(self, name, delta):
+        # Absolute value rather than an increment so the op stays idempotent on replay
+        return ('set', ['stats', name], self.data['stats'][name] + delta)
+    
+    def get_stats(self):
+        return dict(self.data['stats'])
     
     def save(self):
-        with open(self.file, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        with SAVE_SECONDS.time('snapshot'):
+            with self.lock:
+                encoded = encode_snapshot(self.data, self.snapshot.fmt)
+            self.write_snapshot(finish_snapshot(encoded))
+    
+    def write_snapshot(self, payload):
+        self.snapshot.write(payload)
+        SAVE_BYTES.inc('snapshot', amount=len(payload))
+    
+    def replay_journal(self):
+        # (records replayed, whether a torn line was found)
+        if not os.path.exists(self.journal_file):
+            return 0, False
+        
+        count = 0
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    ops = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append
+                    logger.warning(f"⚠️ Dropped a torn record after {count} in {self.journal_file}")
+                    return count, True
+                for op in ops:
+                    self.apply(*op)
+                count += 1
+        return count, False
+    
+    def compact(self):
+        self.save()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.journal_records = 0
+    
+    def apply(self, op, path, value=None):
+        target = self.data
+        for key in path[:-1]:
+            target = target[key]
+        key = path[-1]
+        
+        # Every op is idempotent so replaying a journal over a newer snapshot is safe
+        if op == 'set':
+            target[key] = value
+        elif op == 'del':
+            target.pop(key, None)
+        elif op == 'add':
+            if value not in target[key]:
+                target[key].append(value)
+        elif op == 'discard':
+            if value in target[key]:
+                target[key].remove(value)
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+    
+    def commit(self, *ops):
+        with self.lock:
+            for op in ops:
+                self.apply(*op)
+            
+            if self.writer:
+                self.pending.append(ops)
+                if len(self.pending) >= FLUSH_EVERY:
+                    self.wakeup.set()
+                return
+            
+            if self.backend == 'journal':
+                self.append_journal(self.encode(ops), 1)
+            else:
+                self.save()
+    
+    def encode(self, ops):
+        return json.dumps(ops, separators=(',', ':')) + '\n'
+    
+    def append_journal(self, payload, records):
+        with SAVE_SECONDS.time('journal'):
+            if not self.journal:
+                self.journal = open(self.journal_file, 'a')
+            self.journal.write(payload)
+            self.journal.flush()
+        SAVE_BYTES.inc('journal', amount=len(payload))
+        self.journal_records += records
+        
+        if self.journal_records >= JOURNAL_COMPACT_EVERY:
+            self.compact()
+    
+    def flush(self):
+        with self.flush_lock:
+            mapped = self.message_map.flush()
+            
+            # Serialize under the lock, do the slow file I/O outside it
+            started = time.perf_counter()
+            with self.lock:
+                batch = self.pending
+                self.pending = []
+                settled = self.settled
+                self.settled = []
+                finished = self.finished_broadcasts
+                self.finished_broadcasts = []
+                if not batch:
+                    payload = None
+                elif self.backend == 'journal':
+                    payload = ''.join(self.encode(ops) for ops in batch)
+                else:
+                    payload = encode_snapshot(self.data, self.snapshot.fmt)
+            
+            if payload is None:
+                pass
+            elif self.backend == 'journal':
+                self.append_journal(payload, len(batch))
+            else:
+                self.write_snapshot(finish_snapshot(payload))
+                SAVE_SECONDS.observe(time.perf_counter() - started, 'snapshot')
+            self.archive_payments(settled)
+            for job_id in finished:
+                self.remove_delivery_log(job_id)
+            
+            absorbed = len(batch) + mapped
+            if not absorbed:
+                return 0
+            stats = self.flush_stats
+            stats['commits'] += 1
+            stats['mutations'] += absorbed
+            stats['last_batch'] = absorbed
+            stats['max_batch'] = max(stats['max_batch'], absorbed)
+            logger.debug(f"💾 Flushed {absorbed} mutation(s)")
+            return absorbed
+    
+    def start_writer(self):
+        if not WRITE_BEHIND or self.writer:
+            return
+        self.wakeup = asyncio.Event()
+        self.writer = asyncio.create_task(self.run_writer())
+    
+    async def run_writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self.pending or self.message_map.dirty:
+                await asyncio.to_thread(self.flush)
+    
+    def queue_depth(self):
+        # Commits and message mappings accepted but not on disk yet
+        return len(self.pending) + len(self.message_map.dirty)
+    
+    async def close(self):
+        if self.writer:
+            self.writer.cancel()
+            try:
+                await self.writer
+            except asyncio.CancelledError:
+                pass
+            self.writer = None
+        self.flush()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        for log in self.delivery_logs.values():
+            log.close()
+        self.delivery_logs = {}
+        self.message_map.spill.close()
     
     def add_user(self, uid, username, fname):
         s = str(uid)
         if s not in self.data['users']:
-            self.data['users'][s] = {
-                'id': uid,
-                'username': username,
-                'name': fname,
-                'joined': datetime.now().isoformat(),
-                'is_active': True
-            }
-            self.save()
+            ops = [
+                ('set', ['users', s], {
+                    'id': uid,
+                    'username': username,
+                    'name': fname,
+                    'joined': datetime.now().isoformat(),
+                    'is_active': True
+                }),
+                self.count('total', 1),
+                self.count('active', 1)
+            ]
+            if uid in self.banned:
+                ops.append(self.count('banned', 1))
+            self.commit(*ops)
+            
+            user = self.data['users'][s]
+            self.active_users[s] = user
+            self.index_user('active', user)
+            self.user_search.add(uid, fname, username)
+            if uid in self.banned:
+                self.banned_users[s] = user
+                self.index_user('banned', user)
     
     def get_user(self, uid):
         return self.data['users'].get(str(uid))
     
     def get_all_users(self):
-        return self.data['users']
+        return MappingProxyType(self.data['users'])
     
     def get_active_users(self):
-        return {k: v for k, v in self.data['users'].items() if v.get('is_active', True)}
+        return MappingProxyType(self.active_users)
     
     def get_banned_users(self):
-        return {k: v for k, v in self.data['users'].items() if int(k) in self.data['banned']}
+        return MappingProxyType(self.banned_users)
     
     def ban_user(self, uid):
-        if uid not in self.data['banned']:
-            self.data['banned'].append(uid)
-            if str(uid) in self.data['users']:
-                self.data['users'][str(uid)]['is_active'] = False
-            self.save()
+        if uid not in self.banned:
+            s = str(uid)
+            ops = [('add', ['banned'], uid)]
+            user = self.data['users'].get(s)
+            if user:
+                ops.append(('set', ['users', s, 'is_active'], False))
+                ops.append(self.count('banned', 1))
+                if user.get('is_active', True):
+                    ops.append(self.count('active', -1))
+            self.commit(*ops)
+            
+            self.banned.add(uid)
+            if self.active_users.pop(s, None):
+                self.unindex_user('active', user)
+            if user:
+                self.banned_users[s] = user
+                self.index_user('banned', user)
     
     def unban_user(self, uid):
-        if uid in self.data['banned']:
-            self.data['banned'].remove(uid)
-            if str(uid) in self.data['users']:
-                self.data['users'][str(uid)]['is_active'] = True
-            self.save()
+        if uid in self.banned:
+            s = str(uid)
+            ops = [('discard', ['banned'], uid)]
+            user = self.data['users'].get(s)
+            if user:
+                ops.append(('set', ['users', s, 'is_active'], True))
+                ops.append(self.count('banned', -1))
+                if not user.get('is_active', True):
+                    ops.append(self.count('active', 1))
+            self.commit(*ops)
+            
+            self.banned.discard(uid)
+            if self.banned_users.pop(s, None):
+                self.unindex_user('banned', user)
+            if user and s not in self.active_users:
+                self.active_users[s] = user
+                self.index_user('active', user)
     
     def is_banned(self, uid):
-        return uid in self.data['banned']
+        return uid in self.banned
+    
+    def sorted_keys(self, listing, order):
+        keys = self.user_index.get((listing, order))
+        if keys is None:
+            users = self.active_users if listing == 'active' else self.banned_users
+            keys = self.user_index[listing, order] = sorted(map(USER_ORDERS[order], users.values()))
+        return keys
+    
+    def index_user(self, listing, user):
+        for order, key in USER_ORDERS.items():
+            if (listing, order) in self.user_index:
+                insort(self.user_index[listing, order], key(user))
+    
+    def unindex_user(self, listing, user):
+        for order, key in USER_ORDERS.items():
+            keys = self.user_index.get((listing, order))
+            if keys is None:
+                continue
+            i = bisect_left(keys, key(user))
+            if i < len(keys) and keys[i] == key(user):
+                del keys[i]
+    
+    def search_entries(self):
+        # The list is copied here on the loop, so the worker never iterates a dict that is changing
+        users = list(self.data['users'].values())
+        return ((u['id'], u.get('name'), u.get('username')) for u in users)
+    
+    async def search_users(self, query, limit=10):
+        return await self.user_search.search(query, limit, self.get_user)
+    
+    def get_user_page(self, listing, order, cursor=None, backward=False, limit=20):
+        # cursor is the id of the first (backward) or last (forward) user of the page the owner is on
+        keys = self.sorted_keys(listing, order)
+        user = self.data['users'].get(str(cursor)) if cursor is not None else None
+        if not user:
+            start = 0
+        elif backward:
+            start = max(0, bisect_left(keys, USER_ORDERS[order](user)) - limit)
+        else:
+            start = bisect_right(keys, USER_ORDERS[order](user))
+        
+        page = [self.data['users'][str(key[-1])] for key in keys[start:start + limit]]
+        return page, start > 0, start + limit < len(keys)
     
     def add_pending_payment(self, user_id, plan_days, plan_price, screenshot):
+        payment_id = self.data['payment_seq'] + 1
         payment = {
-            'id': len(self.data['pending_payments']) + 1,
+            'id': payment_id,
             'user_id': user_id,
             'plan_days': plan_days,
             'plan_price': plan_price,
@@ -88,67 +479,185 @@ class Database:
             'time': datetime.now().isoformat(),
             'status': 'pending'
         }
-        self.data['pending_payments'].append(payment)
-        self.save()
+        self.commit(
+            ('set', ['payment_seq'], payment_id),
+            ('set', ['pending_payments', str(payment_id)], payment),
+            self.count('pending_payments', 1)
+        )
         return payment
     
     def get_pending_payments(self):
-        return [p for p in self.data['pending_payments'] if p['status'] == 'pending']
+        return list(self.data['pending_payments'].values())
+    
+    def settle_payment(self, payment_id, status):
+        payment = self.data['pending_payments'].get(str(payment_id))
+        if not payment:
+            return None
+        
+        # Settled payments leave the live store for the append-only archive. The archive only
+        # gets them once the deletion is durable: a crash in between must not leave a payment
+        # both archived and still pending, where it could be approved and credited again
+        settled = dict(payment, status=status)
+        with self.lock:
+            self.commit(
+                ('del', ['pending_payments', str(payment_id)]),
+                self.count('pending_payments', -1)
+            )
+            if self.writer:
+                self.settled.append(settled)
+                return settled
+        self.archive_payments([settled])
+        return settled
     
     def approve_payment(self, payment_id):
-        for p in self.data['pending_payments']:
-            if p['id'] == payment_id:
-                p['status'] = 'approved'
-                self.save()
-                return p
-        return None
+        return self.settle_payment(payment_id, 'approved')
     
     def reject_payment(self, payment_id):
-        for p in self.data['pending_payments']:
-            if p['id'] == payment_id:
-                p['status'] = 'rejected'
-                self.save()
-                return True
-        return False
+        return self.settle_payment(payment_id, 'rejected') is not None
     
     def add_cloned_bot(self, user_id, bot_token, plan_days):
-        expiry = datetime.now() + timedelta(days=plan_days)
-        self.data['cloned_bots'][str(user_id)] = {
+        previous = self.data['cloned_bots'].get(str(user_id))
+        clone = {
             'bot_token': bot_token,
             'created': datetime.now().isoformat(),
-            'expiry': expiry.isoformat(),
+            'expires_at': time.time() + plan_days * 86400,
             'plan_days': plan_days,
-            'active': True
+            'active': True,
+            'notified': False
         }
-        self.save()
+        ops = [('set', ['cloned_bots', str(user_id)], clone)]
+        if not (previous and previous['active']):
+            ops.append(self.count('active_clones', 1))
+        self.commit(*ops)
+        return clone
     
     def get_cloned_bot(self, user_id):
+        # Deactivation is the expiry scheduler's job, a lookup never writes
         bot = self.data['cloned_bots'].get(str(user_id))
-        if bot and bot['active']:
-            expiry = datetime.fromisoformat(bot['expiry'])
-            if datetime.now() > expiry:
-                bot['active'] = False
-                self.save()
-                return None
+        if bot and bot['active'] and bot['expires_at'] > time.time():
             return bot
         return None
     
-    def map_message(self, user_id, owner_msg_id):
-        self.data['message_map'][str(owner_msg_id)] = user_id
-        self.save()
+    def deactivate_clone(self, user_id, expires_at):
+        # expires_at guards against a renewal that landed after the expiry was scheduled
+        bot = self.data['cloned_bots'].get(str(user_id))
+        if not bot or not bot['active'] or bot['expires_at'] != expires_at:
+            return False
+        self.commit(
+            ('set', ['cloned_bots', str(user_id), 'active'], False),
+            self.count('active_clones', -1)
+        )
+        return True
+    
+    def mark_clone_notified(self, user_id):
+        self.commit(('set', ['cloned_bots', str(user_id), 'notified'], True))
+    
+    def get_cloned_bots(self):
+        return self.data['cloned_bots']
+    
+    def map_messages(self, user_id, owner_msg_ids):
+        # All copies of one forward (header, content, album items) land in a single flush
+        for owner_msg_id in owner_msg_ids:
+            self.message_map.put(owner_msg_id, user_id)
+        if not self.writer:
+            self.message_map.flush()
+        elif len(self.message_map.dirty) >= FLUSH_EVERY:
+            self.wakeup.set()
     
     def get_user_from_msg(self, owner_msg_id):
-        return self.data['message_map'].get(str(owner_msg_id))
+        return self.message_map.get(owner_msg_id)
     
     def get_random_greeting(self):
         import random
         return random.choice(self.data['greetings'])
     
     def set_paid_batches(self, text):
-        self.data['paid_batches_text'] = text
-        self.save()
+        self.commit(('set', ['paid_batches_text'], text))
     
     def get_paid_batches(self):
         return self.data['paid_batches_text']
+    
+    def add_broadcast_job(self, from_chat_id, message_id, targets, status_message_id=None, media=None):
+        job_id = self.data['broadcast_seq'] + 1
+        job = {
+            'id': job_id,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'media': media,
+            'status_message_id': status_message_id,
+            'targets': targets,
+            'cursor': 0,
+            'done_ahead': [],
+            'counts': {'sent': 0, 'blocked': 0, 'deactivated': 0, 'failed': 0},
+            'status': 'running',
+            'created': datetime.now().isoformat()
+        }
+        self.commit(
+            ('set', ['broadcast_seq'], job_id),
+            ('set', ['broadcast_jobs', str(job_id)], job)
+        )
+        return job
+    
+    def update_broadcast_job(self, job_id, **fields):
+        if str(job_id) in self.data['broadcast_jobs']:
+            self.commit(*(('set', ['broadcast_jobs', str(job_id), k], v) for k, v in fields.items()))
+    
+    def get_broadcast_job(self, job_id):
+        return self.data['broadcast_jobs'].get(str(job_id))
+    
+    def delivery_file(self, job_id):
+        return f"{os.path.splitext(self.file)[0]}_broadcast_{job_id}.log"
+    
+    def record_broadcast_delivery(self, job_id, index, outcome):
+        # One line per handled target, appended as it happens. Job checkpoints rewrite the
+        # whole store, so they only come when a job stops; resume replays this on top
+        log = self.delivery_logs.get(job_id)
+        if log is None:
+            log = self.delivery_logs[job_id] = open(self.delivery_file(job_id), 'a+')
+            # A crash can tear the last line; cut it off so the next record starts a line of its own
+            log.seek(0)
+            log.truncate(log.read().rfind('\n') + 1)
+        log.write(f"{index} {outcome}\n")
+        log.flush()
+    
+    def get_broadcast_deliveries(self, job_id):
+        try:
+            with open(self.delivery_file(job_id)) as f:
+                # Only whole lines count, a torn one was never acknowledged
+                lines = [line.split() for line in f if line.endswith('\n')]
+        except FileNotFoundError:
+            return []
+        return [(int(index), outcome) for index, outcome in lines]
+    
+    def clear_broadcast_deliveries(self, job_id):
+        # Only once the job's final checkpoint is on disk, or a crash would lose both
+        log = self.delivery_logs.pop(job_id, None)
+        if log:
+            log.close()
+        with self.lock:
+            if self.writer:
+                self.finished_broadcasts.append(job_id)
+                return
+        self.remove_delivery_log(job_id)
+    
+    def remove_delivery_log(self, job_id):
+        try:
+            os.remove(self.delivery_file(job_id))
+        except FileNotFoundError:
+            pass
+    
+    def get_broadcast_jobs(self):
+        return list(self.data['broadcast_jobs'].values())
+
+def open_database(directory='.'):
+    os.makedirs(directory, exist_ok=True)
+    if DB_BACKEND == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(os.path.join(directory, 'data.db'), os.path.join(directory, 'data.json'))
+    return Database(os.path.join(directory, 'data.json'))
+
+def get_db(context):
+    # Clone bots carry their own store in bot_data, the main bot uses the default one
+    return context.bot_data.get('db', db)
 
-db = Database()
+db = open_database()
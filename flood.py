@@ -0,0 +1,84 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Each user may send FLOOD_BURST messages back to back, then one every 1/FLOOD_RATE seconds
+FLOOD_BURST = float(os.getenv('FLOOD_BURST', '5'))
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', '0.5'))
+
+# After FLOOD_MUTE_AFTER dropped messages in a row a user is muted for FLOOD_MUTE seconds (0 = never)
+FLOOD_MUTE = float(os.getenv('FLOOD_MUTE', '0'))
+FLOOD_MUTE_AFTER = int(os.getenv('FLOOD_MUTE_AFTER', '10'))
+
+FLOOD_DROPPED = Counter('bot_flood_dropped_total', "User messages dropped by flood control", ('reason',))
+
+# check() verdicts; WARN is the first drop of a streak, the only one the sender is told about
+ALLOW = 'allow'
+WARN = 'warn'
+DROP = 'drop'
+MUTE = 'mute'
+
+class FloodControl:
+    # Token bucket per user, kept as a (tokens, updated, strikes, muted_until) tuple in an
+    # OrderedDict. Every check moves the user to the end, so the front is always the
+    # longest idle user. A bucket idle long enough to refill and outlive its mute is the
+    # same as no bucket at all, so those are popped from the front without losing anything.
+    def __init__(self, burst=FLOOD_BURST, rate=FLOOD_RATE, mute=FLOOD_MUTE, mute_after=FLOOD_MUTE_AFTER):
+        self.burst = burst
+        self.rate = rate
+        self.mute = mute
+        self.mute_after = mute_after
+        self.idle = max(burst / rate, mute)
+        self.buckets = OrderedDict()
+        self.dropped = 0
+    
+    def check(self, uid, now=None):
+        now = time.monotonic() if now is None else now
+        self.evict(now)
+        
+        entry = self.buckets.get(uid)
+        if entry is None:
+            tokens, strikes, muted_until = self.burst, 0, 0
+        else:
+            tokens, updated, strikes, muted_until = entry
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            self.buckets.move_to_end(uid)
+        
+        if now < muted_until:
+            self.buckets[uid] = (tokens, now, strikes, muted_until)
+            self.drop('muted')
+            return DROP
+        
+        if tokens >= 1:
+            self.buckets[uid] = (tokens - 1, now, 0, 0)
+            return ALLOW
+        
+        strikes += 1
+        if self.mute and strikes >= self.mute_after:
+            self.buckets[uid] = (tokens, now, 0, now + self.mute)
+            logger.info(f"🔇 User {uid} muted for {self.mute:.0f}s after {strikes} dropped messages")
+            self.drop('flood')
+            return MUTE
+        
+        self.buckets[uid] = (tokens, now, strikes, 0)
+        self.drop('flood')
+        return WARN if strikes == 1 else DROP
+    
+    def drop(self, reason):
+        self.dropped += 1
+        FLOOD_DROPPED.inc(reason)
+    
+    def evict(self, now):
+        while self.buckets:
+            uid, entry = next(iter(self.buckets.items()))
+            if now - entry[1] < self.idle:
+                break
+            del self.buckets[uid]
+    
+    def __len__(self):
+        return len(self.buckets)
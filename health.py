@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import time
+
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_LISTEN = os.getenv('HTTP_LISTEN', '0.0.0.0')
+PORT = int(os.getenv('PORT', '8080'))
+
+# /health turns 503 once the event loop falls this far behind (seconds)
+HEALTH_MAX_LAG = float(os.getenv('HEALTH_MAX_LAG', '5'))
+LAG_INTERVAL = 1.0
+
+class HealthServer:
+    # The bot's own HTTP listener: health endpoints, plus the webhook route in webhook mode
+    def __init__(self, listen=HTTP_LISTEN, port=PORT):
+        self.listen = listen
+        self.port = port
+        self.app = None
+        self.last_update = None
+        self.loop_lag = 0.0
+        self.max_loop_lag = 0.0
+        self.web = web.Application()
+        self.web.router.add_get('/', self.home)
+        self.web.router.add_get('/health', self.health)
+        self.web.router.add_get('/ping', self.ping)
+        self.web.router.add_get('/metrics', self.metrics)
+        self.runner = None
+        self.sampler = None
+    
+    async def start(self, app):
+        self.app = app
+        self.runner = web.AppRunner(self.web, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.listen, self.port).start()
+        self.sampler = asyncio.create_task(self.sample_lag())
+        logger.info(f"🌐 HTTP server on {self.listen}:{self.port}")
+    
+    async def stop(self):
+        if self.sampler:
+            self.sampler.cancel()
+        if self.runner:
+            await self.runner.cleanup()
+    
+    async def touch(self, update, context):
+        # Runs in handler group -1, ahead of every other handler
+        self.last_update = time.monotonic()
+    
+    async def sample_lag(self):
+        # A sleep that overshoots means something held the loop
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.loop_lag = time.monotonic() - started - LAG_INTERVAL
+            self.max_loop_lag = max(self.max_loop_lag, self.loop_lag)
+    
+    def queue_depth(self):
+        stores = [self.app.bot_data['db']]
+        clones = self.app.bot_data.get('clones')
+        if clones:
+            stores += [clone.bot_data['db'] for clone in list(clones.apps.values())]
+        return sum(store.queue_depth() for store in stores)
+    
+    async def home(self, request):
+        return web.Response(text="✅ Bot Running!")
+    
+    async def health(self, request):
+        running = bool(self.app and self.app.running)
+        healthy = running and self.loop_lag < HEALTH_MAX_LAG
+        body = {
+            'status': 'ok' if healthy else 'unhealthy',
+            'running': running,
+            'last_update_age': round(time.monotonic() - self.last_update, 1) if self.last_update else None,
+            'loop_lag': round(self.loop_lag, 3),
+            'max_loop_lag': round(self.max_loop_lag, 3),
+            'write_queue': self.queue_depth() if self.app else 0
+        }
+        logger.debug(f"💊 Health check: {body}")
+        return web.json_response(body, status=200 if healthy else 503)
+    
+    async def ping(self, request):
+        logger.debug("🏓 Ping received")
+        return web.Response(text="PONG")
+    
+    async def metrics(self, request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# polling: every bot long-polls getUpdates; webhook: Telegram pushes to our listener
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+
+# Updates handled at the same time per bot; 1 processes them strictly one after another
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+
+def webhook_secret(token):
+    # Stable across restarts and reveals nothing about the token it came from
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    # Runs updates concurrently, except that updates from the same chat wait for each other
+    # and run in arrival order. A user's messages, their conversation state and user_data
+    # therefore never see two handlers at once, while a slow send for one user no longer
+    # holds up everyone else. asyncio.Lock wakes waiters first come, first served.
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, updates holding or waiting for it]; dropped when nobody needs it
+        self.chats = {}
+        # Optional coroutine function(update) awaited in the update's turn, before it takes
+        # a slot; AlbumCollector.hold keeps a chat's updates behind its unsent albums
+        self.hold = None
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    def chat_key(self, update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+    
+    async def process_update(self, update, coroutine):
+        # The chat lock comes before the concurrency slot: an update queued behind its own
+        # chat holds no slot, so one busy chat can't starve every other chat
+        key = self.chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        
+        entry = self.chats.get(key)
+        if entry is None:
+            entry = self.chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if self.hold:
+                    await self.hold(update)
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.chats[key]
+    
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+class WebhookIngress:
+    # Routes /webhook/<secret> on the bot's HTTP server to the Application that owns the secret,
+    # so the main bot and every clone share one listener
+    def __init__(self, web_app, base_url=WEBHOOK_URL):
+        self.base_url = base_url
+        self.routes = {}
+        web_app.router.add_post('/webhook/{secret}', self.handle)
+    
+    async def handle(self, request):
+        secret = request.match_info['secret']
+        app = self.routes.get(secret)
+        if not app:
+            return web.Response(status=404)
+        # Telegram echoes secret_token back in this header, so a guessed path alone isn't enough
+        header = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(header, secret):
+            return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(await request.json(), app.bot)
+        except ValueError:
+            return web.Response(status=400)
+        await app.update_queue.put(update)
+        return web.Response()
+    
+    async def attach(self, app):
+        secret = webhook_secret(app.bot.token)
+        self.routes[secret] = app
+        await app.bot.set_webhook(
+            f"{self.base_url}/webhook/{secret}",
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES
+        )
+    
+    async def detach(self, app, forget=False):
+        self.routes.pop(webhook_secret(app.bot.token), None)
+        if forget:
+            # The bot is gone for good, stop Telegram from retrying deliveries
+            await app.bot.delete_webhook()
+
+async def start_updates(app, ingress=None):
+    if ingress:
+        await ingress.attach(app)
+    else:
+        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+async def stop_updates(app, ingress=None, forget=False):
+    if ingress:
+        await ingress.detach(app, forget)
+    elif app.updater.running:
+        await app.updater.stop()
+
+async def serve(app, ingress):
+    # Same lifecycle as Application.run_polling, with updates arriving through the ingress
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await start_updates(app, ingress)
+        await app.start()
+        await stop.wait()
+    finally:
+        await stop_updates(app, ingress)
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+def run_webhook(app, ingress):
+    if not ingress.base_url:
+        raise RuntimeError("UPDATE_MODE=webhook needs WEBHOOK_URL")
+    asyncio.run(serve(app, ingress))
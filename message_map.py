@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import MESSAGE_MAP_DROPPED, MESSAGE_MAP_LOOKUPS
+
+# How many recent owner message ids stay in memory, and how long any mapping
+# is kept at all (seconds, 0 = forever)
+MESSAGE_MAP_CAPACITY = int(os.getenv('MESSAGE_MAP_CAPACITY', '10000'))
+MESSAGE_MAP_TTL = int(os.getenv('MESSAGE_MAP_TTL', str(30 * 24 * 3600)))
+PURGE_INTERVAL = 3600
+
+# stats key -> (counter, label) it is exported as on /metrics
+STAT_METRICS = {
+    'hits': (MESSAGE_MAP_LOOKUPS, 'hit'),
+    'spill_hits': (MESSAGE_MAP_LOOKUPS, 'spill_hit'),
+    'misses': (MESSAGE_MAP_LOOKUPS, 'miss'),
+    'evictions': (MESSAGE_MAP_DROPPED, 'evicted'),
+    'expired': (MESSAGE_MAP_DROPPED, 'expired')
+}
+
+SPILL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_map (
+    owner_msg_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class SpillStore:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SPILL_SCHEMA)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(message_map)")]
+            if 'ts' not in columns:
+                # Tables created before TTL support carry no timestamp, treat them as fresh
+                self.conn.execute(f"ALTER TABLE message_map ADD COLUMN ts INTEGER NOT NULL DEFAULT {int(time.time())}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS message_map_ts ON message_map(ts)")
+            self.conn.commit()
+    
+    @classmethod
+    def open(cls, file):
+        conn = sqlite3.connect(file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return cls(conn)
+    
+    def get(self, owner_msg_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT user_id, ts FROM message_map WHERE owner_msg_id = ?", (owner_msg_id,)
+            ).fetchone()
+    
+    def put_many(self, entries):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO message_map (owner_msg_id, user_id, ts) VALUES (?, ?, ?)",
+                entries
+            )
+    
+    def delete(self, owner_msg_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM message_map WHERE owner_msg_id = ?", (owner_msg_id,))
+    
+    def purge(self, cutoff):
+        with self.lock, self.conn:
+            return self.conn.execute("DELETE FROM message_map WHERE ts < ?", (cutoff,)).rowcount
+    
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM message_map").fetchone()[0]
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class MessageMap:
+    def __init__(self, spill, capacity=MESSAGE_MAP_CAPACITY, ttl=MESSAGE_MAP_TTL):
+        self.spill = spill
+        self.capacity = capacity
+        self.ttl = ttl
+        self.recent = OrderedDict()
+        self.dirty = {}
+        self.flushing = {}
+        self.lock = threading.Lock()
+        self.last_purge = 0
+        self.stats = {'hits': 0, 'spill_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+    
+    def record(self, stat, amount=1):
+        self.stats[stat] += amount
+        counter, label = STAT_METRICS[stat]
+        counter.inc(label, amount=amount)
+    
+    def expired(self, ts, now):
+        return self.ttl and ts < now - self.ttl
+    
+    def put(self, owner_msg_id, user_id):
+        entry = (user_id, int(time.time()))
+        with self.lock:
+            self.recent[owner_msg_id] = entry
+            self.recent.move_to_end(owner_msg_id)
+            self.dirty[owner_msg_id] = entry
+            
+            while len(self.recent) > self.capacity:
+                # Oldest entries only need to survive on disk; dirty ones get written by the next flush
+                self.recent.popitem(last=False)
+                self.record('evictions')
+    
+    def get(self, owner_msg_id):
+        now = time.time()
+        with self.lock:
+            entry = self.recent.get(owner_msg_id)
+            if entry:
+                if self.expired(entry[1], now):
+                    del self.recent[owner_msg_id]
+                    self.record('expired')
+                    self.record('misses')
+                    return None
+                self.recent.move_to_end(owner_msg_id)
+                self.record('hits')
+                return entry[0]
+            
+            entry = self.dirty.get(owner_msg_id) or self.flushing.get(owner_msg_id)
+        if not entry:
+            entry = self.spill.get(owner_msg_id)
+        if not entry:
+            self.record('misses')
+            return None
+        if self.expired(entry[1], now):
+            self.spill.delete(owner_msg_id)
+            self.record('expired')
+            self.record('misses')
+            return None
+        self.record('spill_hits')
+        return entry[0]
+    
+    def flush(self):
+        with self.lock:
+            dirty = self.flushing = self.dirty
+            self.dirty = {}
+        if dirty:
+            # Keep the batch visible to get() until it is actually on disk
+            self.spill.put_many((mid, uid, ts) for mid, (uid, ts) in dirty.items())
+            self.flushing = {}
+        
+        now = time.time()
+        if self.ttl and now - self.last_purge > PURGE_INTERVAL:
+            self.last_purge = now
+            self.record('expired', self.spill.purge(int(now - self.ttl)))
+        return len(dirty)
+    
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['spill_hits'] + self.stats['misses']
+        return (self.stats['hits'] + self.stats['spill_hits']) / lookups if lookups else 0.0
+    
+    def __len__(self):
+        return self.spill.count() + len(self.dirty)
@@ -0,0 +1,137 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Prometheus text exposition without the client library. Every sample is a few
+# integer increments under an uncontended lock, so this stays on in production.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+class Counter:
+    kind = 'counter'
+    
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+    
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in values.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+class Histogram:
+    kind = 'histogram'
+    
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> per-bucket counts (non-cumulative, last slot is +Inf), sum, count
+        self.series = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def observe(self, value, *labels):
+        slot = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def time(self, *labels):
+        return Timer(self, labels)
+    
+    def samples(self):
+        with self.lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self.series.items()}
+        for labels, (counts, total, n) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, ('le', bound))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {n}"
+
+class Gauge:
+    kind = 'gauge'
+    
+    def __init__(self, name, help, labels=(), collect=None, every=0):
+        # collect() returns {label values: value} and runs at scrape time, at most once per `every` seconds
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.every = every
+        self.cached = {}
+        self.collected_at = None
+        REGISTRY.append(self)
+    
+    def samples(self):
+        now = time.monotonic()
+        if self.collected_at is None or now - self.collected_at >= self.every:
+            self.cached = self.collect()
+            self.collected_at = now
+        for labels, value in self.cached.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', "Time spent in update handlers", ('handler', 'route'))
+API_SECONDS = Histogram('bot_api_request_seconds', "Bot API request latency", ('method',))
+API_ERRORS = Counter('bot_api_errors_total', "Bot API requests that failed", ('method', 'reason'))
+SAVE_SECONDS = Histogram('db_save_seconds', "Time to serialize and write the store", ('kind',))
+SAVE_BYTES = Counter('db_written_bytes_total', "Bytes written by the store", ('kind',))
+MESSAGE_MAP_LOOKUPS = Counter('bot_message_map_lookups_total', "Reply routing lookups by where they were answered", ('result',))
+MESSAGE_MAP_DROPPED = Counter('bot_message_map_dropped_total', "Message mappings evicted from memory or expired", ('reason',))
+
+def timed(handler, route=''):
+    # Decorator for PTB callbacks: times the handler under its name and a fixed route
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with HANDLER_SECONDS.time(handler, route):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
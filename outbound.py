@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict, deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Bot API allows roughly 30 messages/second across chats and about one per second in a chat
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '25'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_RETRIES = int(os.getenv('OUTBOUND_RETRIES', '3'))
+
+# Priority classes, passed as rate_limit_args. Anything untagged is interactive:
+# owner replies, payment notices and answers to button presses.
+INTERACTIVE = 0
+FORWARD = 1
+BROADCAST = 2
+PRIORITY_NAMES = ('interactive', 'forward', 'broadcast')
+
+SCHEDULERS = weakref.WeakSet()
+
+def queue_depths():
+    depths = dict.fromkeys(((name,) for name in PRIORITY_NAMES), 0)
+    for scheduler in list(SCHEDULERS):
+        for priority, waiting in enumerate(scheduler.waiting):
+            depths[(PRIORITY_NAMES[priority],)] += sum(len(waiters) for waiters in waiting.values())
+    return depths
+
+OUTBOUND_QUEUE = Gauge('bot_outbound_queue', "Bot API sends waiting for a rate limit slot", ('priority',), collect=queue_depths)
+OUTBOUND_WAIT = Histogram('bot_outbound_wait_seconds', "Time a send waited for a rate limit slot", ('priority',))
+
+class OutboundScheduler(BaseRateLimiter):
+    # Every Bot API call that targets a chat waits here for a slot. Slots come from a
+    # global token bucket and a per-chat one; the dispatcher hands them to the highest
+    # priority class first and round-robins between chats inside a class, so a chat
+    # held back by its own limit never blocks the others.
+    def __init__(self, rate=OUTBOUND_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 retries=OUTBOUND_RETRIES):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retries = retries
+        # priority -> chat_id -> deque of futures waiting for a slot
+        self.waiting = [OrderedDict() for _ in PRIORITY_NAMES]
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # chat_id -> (tokens, updated), least recently used first; full buckets are forgotten
+        self.chats = OrderedDict()
+        self.chat_idle = chat_burst / chat_rate
+        self.wakeup = None
+        self.dispatcher = None
+        SCHEDULERS.add(self)
+    
+    async def initialize(self):
+        # ExtBot calls this on every initialize(), not just the first
+        if self.dispatcher:
+            return
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self.dispatch())
+    
+    async def shutdown(self):
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+        for waiting in self.waiting:
+            for waiters in waiting.values():
+                for future in waiters:
+                    future.cancel()
+            waiting.clear()
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # answerCallbackQuery, getMe, setWebhook... don't count against message limits
+            return await callback(*args, **kwargs)
+        
+        priority = rate_limit_args or INTERACTIVE
+        attempt = 0
+        while True:
+            await self.acquire(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                # A 429 applies to the whole bot, so hold every class back
+                self.pause(e.retry_after)
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                logger.warning(f"⏳ Flood wait {e.retry_after}s on {endpoint}, retrying")
+    
+    async def acquire(self, priority, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        waiting = self.waiting[priority]
+        if chat_id not in waiting:
+            waiting[chat_id] = deque()
+        waiting[chat_id].append(future)
+        self.wakeup.set()
+        
+        started = time.monotonic()
+        try:
+            await future
+        finally:
+            OUTBOUND_WAIT.observe(time.monotonic() - started, PRIORITY_NAMES[priority])
+    
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.wakeup.set()
+    
+    def chat_tokens(self, chat_id, now):
+        entry = self.chats.get(chat_id)
+        if entry is None:
+            return self.chat_burst
+        tokens, updated = entry
+        return min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+    
+    def next_waiter(self, now):
+        # (priority, chat_id, None) for the send that may go now, or
+        # (None, None, seconds until a waiting chat frees up) when none may
+        ready_in = None
+        for priority, waiting in enumerate(self.waiting):
+            for chat_id in waiting:
+                tokens = self.chat_tokens(chat_id, now)
+                if tokens >= 1:
+                    return priority, chat_id, None
+                wait = (1 - tokens) / self.chat_rate
+                ready_in = wait if ready_in is None else min(ready_in, wait)
+        return None, None, ready_in
+    
+    def grant(self, priority, chat_id, now):
+        waiting = self.waiting[priority]
+        waiters = waiting[chat_id]
+        future = waiters.popleft()
+        if waiters:
+            # Round robin: this chat goes behind the others of its class
+            waiting.move_to_end(chat_id)
+        else:
+            del waiting[chat_id]
+        if future.done():
+            # The caller was cancelled while queued; the slot stays free
+            return
+        
+        future.set_result(None)
+        self.tokens -= 1
+        self.chats[chat_id] = (self.chat_tokens(chat_id, now) - 1, now)
+        self.chats.move_to_end(chat_id)
+    
+    def evict(self, now):
+        while self.chats:
+            chat_id, (_, updated) = next(iter(self.chats.items()))
+            if now - updated < self.chat_idle:
+                break
+            del self.chats[chat_id]
+    
+    async def dispatch(self):
+        while True:
+            now = time.monotonic()
+            self.evict(now)
+            
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            
+            priority, chat_id, ready_in = self.next_waiter(now)
+            if priority is not None:
+                self.grant(priority, chat_id, now)
+                continue
+            
+            # Nothing may go yet: sleep until a chat frees up or a new send arrives
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), ready_in)
+            except asyncio.TimeoutError:
+                pass
@@ -1,7 +1,13 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
-from database import db
+from albums import media_item
+from database import get_db
+from broadcast import start_broadcast, pause_broadcast, unpause_broadcast, cancel_broadcast, running_broadcasts
+from metrics import timed
+from router import choice, router
 import logging
+from functools import partial
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +26,10 @@ async def owner_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("👥 Active Users", callback_data="owner_active"),
             InlineKeyboardButton("🚫 Banned Users", callback_data="owner_banned")
         ],
-        [InlineKeyboardButton("📢 Broadcast Message", callback_data="owner_broadcast")],
+        [
+            InlineKeyboardButton("📢 Broadcast Message", callback_data="owner_broadcast"),
+            InlineKeyboardButton("📋 Broadcast Jobs", callback_data="owner_jobs")
+        ],
         [
             InlineKeyboardButton("🚫 Ban User", callback_data="owner_ban"),
             InlineKeyboardButton("✅ Unban User", callback_data="owner_unban")
@@ -38,24 +47,24 @@ Full control access
     
     await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
+@router.route('owner_stats')
 async def owner_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
-    all_users = db.get_all_users()
-    active = db.get_active_users()
-    banned = db.get_banned_users()
-    pending = db.get_pending_payments()
-    clones = db.data['cloned_bots']
+    stats = db.get_stats()
+    flood = context.bot_data['flood']
     
     text = f"""
 📊 Bot Statistics
 ━━━━━━━━━━━━━━━━
-👥 Total Users: {len(all_users)}
-✅ Active: {len(active)}
-🚫 Banned: {len(banned)}
-💳 Pending Payments: {len(pending)}
-🤖 Active Clones: {sum(1 for c in clones.values() if c.get('active', False))}
+👥 Total Users: {stats['total']}
+✅ Active: {stats['active']}
+🚫 Banned: {stats['banned']}
+💳 Pending Payments: {stats['pending_payments']}
+🤖 Active Clones: {stats['active_clones']}
+🌊 Flood Dropped: {flood.dropped} (since restart)
 
 📋 Fixed Plans:
 • 1 Day - ₹2
@@ -66,63 +75,125 @@ async def owner_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await query.message.reply_text(text)
 
+USER_PAGE_SIZE = 20
+FIND_LIMIT = 10
+LISTING_TITLES = {'active': "✅ Active Users", 'banned': "🚫 Banned Users"}
+ORDER_LABELS = {'joined': "join date", 'name': "name"}
+
+def user_button(user):
+    name = user['name']
+    username = user.get('username', 'None')
+    button_text = f"{name} (@{username})"
+    return InlineKeyboardButton(button_text, callback_data=f"userinfo_{user['id']}")
+
+def user_page(db, listing, order, cursor=None, backward=False):
+    users, has_prev, has_next = db.get_user_page(listing, order, cursor, backward, USER_PAGE_SIZE)
+    if not users and cursor is not None:
+        # Everyone past the cursor was banned or unbanned meanwhile, start over
+        users, has_prev, has_next = db.get_user_page(listing, order, limit=USER_PAGE_SIZE)
+    if not users:
+        return None, None
+    
+    text = (
+        f"{LISTING_TITLES[listing]} ({db.get_stats()[listing]})\n━━━━━━━━━━━━━━━━\n\n"
+        f"Sorted by {ORDER_LABELS[order]}"
+    )
+    
+    keyboard = [[user_button(user)] for user in users]
+    
+    # The cursor is the id of the user on the page edge; the store turns it back into a sort position
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"users_{listing}_{order}_prev_{users[0]['id']}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"users_{listing}_{order}_next_{users[-1]['id']}"))
+    if nav:
+        keyboard.append(nav)
+    
+    other = 'name' if order == 'joined' else 'joined'
+    keyboard.append([
+        InlineKeyboardButton(f"🔃 Sort by {ORDER_LABELS[other]}", callback_data=f"users_{listing}_{other}_first_0")
+    ])
+    
+    return text, InlineKeyboardMarkup(keyboard)
+
+@router.route('owner_active')
 async def owner_active_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
-    active = db.get_active_users()
-    
-    if not active:
+    text, markup = user_page(db, 'active', 'joined')
+    if not text:
         await query.message.reply_text("No active users.")
         return
     
-    text = f"✅ Active Users ({len(active)})\n━━━━━━━━━━━━━━━━\n\n"
-    
-    keyboard = []
-    for uid, user in list(active.items())[:50]:
-        name = user['name']
-        username = user.get('username', 'None')
-        button_text = f"{name} (@{username})"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"userinfo_{uid}")])
-    
-    if len(active) > 50:
-        text += "Showing first 50 users\n"
-    
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.message.reply_text(text, reply_markup=markup)
 
+@router.route('owner_banned')
 async def owner_banned_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
-    banned = db.get_banned_users()
-    
-    if not banned:
+    text, markup = user_page(db, 'banned', 'joined')
+    if not text:
         await query.message.reply_text("No banned users.")
         return
     
-    text = f"🚫 Banned Users ({len(banned)})\n━━━━━━━━━━━━━━━━\n\n"
+    await query.message.reply_text(text, reply_markup=markup)
+
+@router.route('users', choice('active', 'banned'), choice('joined', 'name'), choice('first', 'prev', 'next'), int)
+async def user_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, listing, order, step, cursor):
+    db = get_db(context)
+    query = update.callback_query
+    await query.answer()
+    
+    if step == 'first':
+        text, markup = user_page(db, listing, order)
+    else:
+        text, markup = user_page(db, listing, order, cursor, backward=step == 'prev')
+    if not text:
+        text, markup = f"No {listing} users.", None
+    
+    # Page through the listing in place rather than posting a new message per tap
+    try:
+        await query.message.edit_text(text, reply_markup=markup)
+    except BadRequest as e:
+        if 'not modified' not in e.message.lower():
+            raise
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
+    query = ' '.join(context.args)
     
-    keyboard = []
-    for uid, user in banned.items():
-        name = user['name']
-        username = user.get('username', 'None')
-        button_text = f"{name} (@{username})"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"userinfo_{uid}")])
+    if not query:
+        await update.message.reply_text("🔎 Usage: /find <name, @username or ID>")
+        return
     
-    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    users = await db.search_users(query, FIND_LIMIT)
+    if not users:
+        await update.message.reply_text(f"🔎 No users match \"{query}\".")
+        return
+    
+    await update.message.reply_text(
+        f"🔎 Results for \"{query}\"",
+        reply_markup=InlineKeyboardMarkup([[user_button(user)] for user in users])
+    )
 
-async def user_info_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@router.route('userinfo', int)
+async def user_info_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, uid):
+    db = get_db(context)
     query = update.callback_query
-    uid = query.data.split('_')[1]
     
-    user = db.get_user(int(uid))
+    user = db.get_user(uid)
     if not user:
         await query.answer("User not found", show_alert=True)
         return
     
     await query.answer()
     
-    is_banned = db.is_banned(int(uid))
+    is_banned = db.is_banned(uid)
     status = "🚫 Banned" if is_banned else "✅ Active"
     
     text = f"""
@@ -143,9 +214,10 @@ Joined: {user['joined'][:10]}
     
     await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
-async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@router.route('ban', int)
+async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, uid):
+    db = get_db(context)
     query = update.callback_query
-    uid = int(query.data.split('_')[1])
     
     db.ban_user(uid)
     await query.answer("✅ User banned!", show_alert=True)
@@ -154,9 +226,10 @@ async def ban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.message.edit_text(f"✅ User {user['name']} ({uid}) banned.")
     logger.info(f"�� User {uid} banned")
 
-async def unban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@router.route('unban', int)
+async def unban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, uid):
+    db = get_db(context)
     query = update.callback_query
-    uid = int(query.data.split('_')[1])
     
     db.unban_user(uid)
     await query.answer("✅ User unbanned!", show_alert=True)
@@ -165,26 +238,29 @@ async def unban_user_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.message.edit_text(f"✅ User {user['name']} ({uid}) unbanned.")
     logger.info(f"✅ User {uid} unbanned")
 
+@router.route('owner_ban')
 async def owner_ban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     await query.message.reply_text(
         "🚫 Ban User\n━━━━━━━━━━━━━━━━\n\n"
-        "Send user ID to ban:"
+        "Send user ID to ban (or look it up with /find):"
     )
     context.user_data['awaiting_ban'] = True
 
+@router.route('owner_unban')
 async def owner_unban_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     await query.message.reply_text(
         "✅ Unban User\n━━━━━━━━━━━━━━━━\n\n"
-        "Send user ID to unban:"
+        "Send user ID to unban (or look it up with /find):"
     )
     context.user_data['awaiting_unban'] = True
 
+@router.route('owner_broadcast')
 async def owner_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -197,44 +273,86 @@ async def owner_broadcast_callback(update: Update, context: ContextTypes.DEFAULT
     )
     return BROADCAST_MSG
 
+@timed('receive_broadcast')
 async def receive_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = update.message
-    users = db.get_active_users()
-    
-    total = len(users)
-    status = await msg.reply_text(f"📤 Broadcasting to {total} users...")
-    
-    success = 0
-    failed = 0
-    
-    for uid in users.keys():
-        try:
-            if msg.text:
-                await context.bot.send_message(int(uid), msg.text)
-            elif msg.photo:
-                await context.bot.send_photo(int(uid), msg.photo[-1].file_id, caption=msg.caption or "")
-            elif msg.video:
-                await context.bot.send_video(int(uid), msg.video.file_id, caption=msg.caption or "")
-            elif msg.document:
-                await context.bot.send_document(int(uid), msg.document.file_id, caption=msg.caption or "")
-            elif msg.voice:
-                await context.bot.send_voice(int(uid), msg.voice.file_id)
-            elif msg.audio:
-                await context.bot.send_audio(int(uid), msg.audio.file_id, caption=msg.caption or "")
-            success += 1
-        except:
-            failed += 1
-    
-    await status.edit_text(
-        f"✅ Broadcast Complete!\n\n"
-        f"✅ Sent: {success}\n"
-        f"❌ Failed: {failed}"
-    )
+    if msg.media_group_id:
+        # The rest of the album arrives after the conversation ended and joins in handle_media_message
+        context.bot_data['albums'].start(msg, partial(begin_broadcast, context))
+        return ConversationHandler.END
     
-    logger.info(f"📢 Broadcast: {success} sent, {failed} failed")
+    await begin_broadcast(context, [msg])
     return ConversationHandler.END
 
+async def begin_broadcast(context, messages):
+    db = get_db(context)
+    msg = messages[0]
+    targets = [int(uid) for uid in db.get_active_users()]
+    
+    # Albums are re-sent from their file ids, a single message is copied
+    media = [media_item(m) for m in messages] if len(messages) > 1 else None
+    
+    status = await msg.reply_text(f"📤 Broadcasting to {len(targets)} users...")
+    
+    # Persist the job first so a restart picks it up where it left off
+    job = db.add_broadcast_job(msg.chat_id, msg.message_id, targets, status.message_id, media)
+    start_broadcast(context.application, job)
+    
+    logger.info(f"📢 Broadcast #{job['id']} started for {len(targets)} users")
+
+@router.route('owner_jobs')
+async def owner_jobs_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
+    query = update.callback_query
+    await query.answer()
+    
+    jobs = [j for j in db.get_broadcast_jobs() if j['status'] in ('running', 'paused')]
+    
+    if not jobs:
+        await query.message.reply_text("📋 No running broadcasts.")
+        return
+    
+    text = f"📋 Broadcast Jobs ({len(jobs)})\n━━━━━━━━━━━━━━━━\n\n"
+    keyboard = []
+    # Stored jobs are only checkpointed when they stop, running ones report their live cursor
+    running = running_broadcasts(context.application)
+    for job in jobs:
+        icon = "📤" if job['status'] == 'running' else "⏸"
+        cursor = running[job['id']].cursor if job['id'] in running else job['cursor']
+        text += f"{icon} #{job['id']} - {cursor}/{len(job['targets'])} - {job['created'][:16]}\n"
+        
+        if job['status'] == 'running':
+            toggle = InlineKeyboardButton(f"⏸ Pause #{job['id']}", callback_data=f"job_pause_{job['id']}")
+        else:
+            toggle = InlineKeyboardButton(f"▶️ Resume #{job['id']}", callback_data=f"job_resume_{job['id']}")
+        keyboard.append([
+            toggle,
+            InlineKeyboardButton(f"✖️ Cancel #{job['id']}", callback_data=f"job_cancel_{job['id']}")
+        ])
+    
+    await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+@router.route('job', choice('pause', 'resume', 'cancel'), int)
+async def job_action_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action, job_id):
+    query = update.callback_query
+    
+    if action == 'pause':
+        done = pause_broadcast(context.application, job_id)
+    elif action == 'resume':
+        done = unpause_broadcast(context.application, job_id)
+    else:
+        done = cancel_broadcast(context.application, job_id)
+    
+    if not done:
+        await query.answer("Job can't be changed right now.", show_alert=True)
+        return
+    
+    await query.answer(f"✅ Broadcast #{job_id}: {action}")
+    logger.info(f"📋 Broadcast #{job_id}: {action}")
+
+@router.route('edit_batches')
 async def edit_batches_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
@@ -249,6 +367,7 @@ async def edit_batches_callback(update: Update, context: ContextTypes.DEFAULT_TY
     return EDIT_BATCHES
 
 async def receive_batches_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     text = update.message.text
     db.set_paid_batches(text)
     
@@ -260,7 +379,9 @@ async def receive_batches_text(update: Update, context: ContextTypes.DEFAULT_TYP
     logger.info("📚 Paid batches list updated")
     return ConversationHandler.END
 
+@router.route('owner_payments')
 async def owner_payments_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
@@ -0,0 +1,67 @@
+import logging
+
+from telegram.ext import CallbackQueryHandler
+
+from metrics import HANDLER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class CallbackRouter:
+    # callback_data is "<route>_<payload>_<payload>..." where the route may contain
+    # underscores itself (owner_stats, job_pause). Routes are looked up longest prefix
+    # first, so owner_ban and ban_42 never need special cases.
+    def __init__(self):
+        self.routes = {}
+        self.max_depth = 0
+    
+    def route(self, name, *schema):
+        # schema holds one converter per payload segment, e.g. route('approve', int, int)
+        def decorator(func):
+            if name in self.routes:
+                raise ValueError(f"Callback route {name} registered twice")
+            self.routes[name] = (func, schema)
+            self.max_depth = max(self.max_depth, name.count('_') + 1)
+            return func
+        return decorator
+    
+    def resolve(self, data):
+        parts = data.split('_')
+        for depth in range(min(len(parts), self.max_depth), 0, -1):
+            name = '_'.join(parts[:depth])
+            entry = self.routes.get(name)
+            if not entry:
+                continue
+            func, schema = entry
+            raw = parts[depth:]
+            if len(raw) != len(schema):
+                continue
+            try:
+                return name, func, [convert(value) for convert, value in zip(schema, raw)]
+            except ValueError:
+                continue
+        return None, None, None
+    
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        name, func, payload = self.resolve(query.data or '')
+        if not func:
+            logger.debug(f"🔘 No route for callback {query.data!r}")
+            HANDLER_SECONDS.observe(0, 'handle_callback', 'unrouted')
+            await query.answer()
+            return
+        with HANDLER_SECONDS.time('handle_callback', name):
+            return await func(update, context, *payload)
+    
+    def handler(self):
+        return CallbackQueryHandler(self.dispatch)
+
+def choice(*values):
+    # Payload converter that only accepts one of a fixed set of words
+    def convert(value):
+        if value not in values:
+            raise ValueError(value)
+        return value
+    return convert
+
+# Shared by the owner and user handler modules; every bot, clones included, dispatches through it
+router = CallbackRouter()
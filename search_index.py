@@ -0,0 +1,140 @@
+import asyncio
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+
+WORD = re.compile(r'\w+')
+
+def tokens(text):
+    return WORD.findall((text or '').lower())
+
+def trigrams(token):
+    # Short tokens are their own single gram so "al" still finds "al"
+    if len(token) < 3:
+        return {token}
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+class UserSearchIndex:
+    # In-memory index over user names and usernames for owner lookup.
+    # Everything is keyed by distinct token, and names repeat a lot: a sorted
+    # token list answers prefix queries with one bisect, trigram postings
+    # over tokens catch typos and matches inside a word.
+    def __init__(self):
+        self.postings = {}
+        self.sorted_tokens = []
+        self.grams = {}
+        self.by_username = {}
+    
+    def add_token(self, token, uid):
+        users = self.postings.get(token)
+        if users is None:
+            users = self.postings[token] = set()
+            for gram in trigrams(token):
+                self.grams.setdefault(gram, set()).add(token)
+        users.add(uid)
+    
+    def add(self, uid, name, username):
+        if username:
+            self.by_username[username.lower()] = uid
+        for token in tokens(name) + tokens(username):
+            if token not in self.postings:
+                insort(self.sorted_tokens, token)
+            self.add_token(token, uid)
+    
+    def build(self, entries):
+        # Bulk load from (id, name, username) tuples: one sort instead of an insort per token
+        for uid, name, username in entries:
+            if username:
+                self.by_username[username.lower()] = uid
+            for token in tokens(name) + tokens(username):
+                self.add_token(token, uid)
+        self.sorted_tokens = sorted(self.postings)
+    
+    def matching(self, term, max_tokens=2000):
+        # Ids holding the term as a whole token, and ids holding a longer token that starts with it
+        exact = self.postings.get(term, set())
+        prefixed = set()
+        i = bisect_left(self.sorted_tokens, term)
+        end = min(len(self.sorted_tokens), i + max_tokens)
+        while i < end and self.sorted_tokens[i].startswith(term):
+            if self.sorted_tokens[i] != term:
+                prefixed |= self.postings[self.sorted_tokens[i]]
+            i += 1
+        return exact, prefixed
+    
+    def search(self, query, limit=10):
+        query = query.strip().lstrip('@').lower()
+        terms = tokens(query)
+        if not terms:
+            return []
+        
+        scores = Counter()
+        if query in self.by_username:
+            scores[self.by_username[query]] += 100
+        
+        # Users matching every term by whole word or prefix rank first, whole words above prefixes
+        matches = [self.matching(term) for term in terms]
+        candidates = set.intersection(*(exact | prefixed for exact, prefixed in matches))
+        for uid in candidates:
+            scores[uid] += sum(40 if uid in exact else 20 for exact, _ in matches)
+        
+        # Fuzzy fill: tokens holding at least half of the query's trigrams
+        if len(scores) < limit:
+            grams = set().union(*(trigrams(term) for term in terms))
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+            for token, count in shared.items():
+                if count * 2 >= len(grams):
+                    for uid in self.postings[token]:
+                        scores[uid] += 10 * count / len(grams)
+        
+        return [uid for uid, _ in scores.most_common(limit)]
+
+class UserSearch:
+    # The /find index both stores share, built on the first search. At a million users
+    # that takes seconds, so it runs in a worker thread and the event loop keeps going;
+    # users added meanwhile are indexed once it is done.
+    def __init__(self, entries):
+        # entries() runs on the loop and returns (id, name, username) tuples the worker can consume
+        self.entries = entries
+        self.index = None
+        self.building = None
+        self.added = []
+    
+    async def build(self):
+        index = UserSearchIndex()
+        try:
+            await asyncio.to_thread(index.build, self.entries())
+        except BaseException:
+            # Every waiter sees the error; the next /find starts a fresh build
+            self.building = None
+            self.added = []
+            raise
+        for entry in self.added:
+            index.add(*entry)
+        self.added = []
+        self.index = index
+    
+    async def ready(self):
+        if self.index is None:
+            if self.building is None:
+                self.building = asyncio.ensure_future(self.build())
+            # A /find cancelled while waiting must not cancel the build for everyone else
+            await asyncio.shield(self.building)
+    
+    def add(self, uid, name, username):
+        if self.index is not None:
+            self.index.add(uid, name, username)
+        elif self.building is not None:
+            self.added.append((uid, name, username))
+    
+    async def search(self, query, limit, get_user):
+        await self.ready()
+        query = query.strip()
+        found = self.index.search(query, limit)
+        if query.isdigit():
+            # A bare number is tried as an id first
+            found = [int(query)] + [uid for uid in found if uid != int(query)]
+        users = (get_user(uid) for uid in found[:limit])
+        return [user for user in users if user]
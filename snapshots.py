@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+import zlib
+from datetime import datetime
+
+import msgpack
+
+logger = logging.getLogger(__name__)
+
+# json    - indented data.json, readable and hand-editable
+# msgpack - data.snap: one zlib-compressed msgpack section per top-level key
+SNAPSHOT_FORMAT = os.getenv('DB_SNAPSHOT_FORMAT', 'json')
+
+# Every DB_BACKUP_INTERVAL seconds the snapshot being replaced is kept in DB_BACKUP_DIR;
+# the newest DB_BACKUP_KEEP of them stay (0 = no backups)
+BACKUP_KEEP = int(os.getenv('DB_BACKUP_KEEP', '5'))
+BACKUP_INTERVAL = float(os.getenv('DB_BACKUP_INTERVAL', '3600'))
+BACKUP_DIR = os.getenv('DB_BACKUP_DIR', 'backups')
+
+MAGIC = b'TRBSNAP1'
+SECTION = struct.Struct('>HQ')
+EXTENSIONS = {'json': '.json', 'msgpack': '.snap'}
+
+def snapshot_path(file, fmt):
+    return os.path.splitext(file)[0] + EXTENSIONS[fmt]
+
+def detach(data):
+    # Journal ops reach at most one record deep (('set', ['users', uid, 'is_active'], ...)),
+    # so copying the top-level containers and the records in them is enough to keep later
+    # mutations out of the copy. Anything deeper is only ever replaced, never changed in place.
+    copy = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            value = {k: v.copy() if isinstance(v, dict) else v for k, v in value.items()}
+        elif isinstance(value, list):
+            value = list(value)
+        copy[key] = value
+    return copy
+
+def encode(data, fmt):
+    # Runs under the store lock, so only the cheap part happens here; finish() does the rest.
+    # Indented json is pure Python and about 10x slower than the copy it encodes from.
+    if fmt == 'json':
+        return detach(data)
+    return [(key, msgpack.packb(value)) for key, value in data.items()]
+
+def finish(encoded):
+    if isinstance(encoded, dict):
+        return json.dumps(encoded, indent=2).encode()
+    parts = [MAGIC]
+    for key, packed in encoded:
+        name = key.encode()
+        body = zlib.compress(packed, 1)
+        parts += [SECTION.pack(len(name), len(body)), name, body]
+    return b''.join(parts)
+
+def decode(payload):
+    if not payload.startswith(MAGIC):
+        return json.loads(payload)
+    try:
+        return decode_sections(payload)
+    except (struct.error, zlib.error) as e:
+        raise ValueError(e) from e
+
+def decode_sections(payload):
+    data = {}
+    view = memoryview(payload)
+    pos = len(MAGIC)
+    while pos < len(payload):
+        name_len, body_len = SECTION.unpack_from(view, pos)
+        pos += SECTION.size
+        name = bytes(view[pos:pos + name_len]).decode()
+        pos += name_len
+        if pos + body_len > len(payload):
+            raise ValueError(f"Snapshot section {name} is truncated")
+        data[name] = msgpack.unpackb(zlib.decompress(view[pos:pos + body_len]), strict_map_key=False)
+        pos += body_len
+    return data
+
+class SnapshotFile:
+    # The store's snapshot on disk: atomic replace, periodic backups and a fallback
+    # to the newest backup when the current file can't be read
+    def __init__(self, file, fmt=SNAPSHOT_FORMAT, keep=BACKUP_KEEP, interval=BACKUP_INTERVAL, backup_dir=BACKUP_DIR):
+        self.fmt = fmt
+        self.path = snapshot_path(file, fmt)
+        # The same store in the other format, read once when switching formats
+        self.other = snapshot_path(file, 'msgpack' if fmt == 'json' else 'json')
+        self.keep = keep
+        self.interval = interval
+        self.backup_dir = os.path.join(os.path.dirname(os.path.abspath(file)), backup_dir)
+        self.base = os.path.splitext(os.path.basename(file))[0]
+        self.last_backup = 0.0
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def read(self):
+        # None when there is no snapshot at all
+        for path in (self.path, self.other):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    return decode(f.read())
+            except ValueError as e:
+                logger.error(f"❌ Snapshot {path} unreadable ({e}), trying backups")
+                return self.read_backup()
+        return None
+    
+    def read_backup(self):
+        for path in reversed(self.backups()):
+            try:
+                with open(path, 'rb') as f:
+                    data = decode(f.read())
+            except ValueError:
+                continue
+            logger.warning(f"⚠️ Restored from backup {path}")
+            return data
+        raise RuntimeError(f"No readable snapshot or backup for {self.path}")
+    
+    def write(self, payload):
+        # Write to a temp file first so a crash never leaves a half-written snapshot
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.keep and time.monotonic() - self.last_backup >= self.interval:
+            self.backup()
+        os.replace(tmp, self.path)
+        if os.path.exists(self.other):
+            # Switched formats: the old file becomes a backup instead of a stale twin
+            if self.keep:
+                self.backup(self.other)
+            os.remove(self.other)
+    
+    def backup(self, path=None):
+        path = path or self.path
+        self.last_backup = time.monotonic()
+        if not os.path.exists(path):
+            return
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        target = os.path.join(self.backup_dir, f"{self.base}-{stamp}{os.path.splitext(path)[1]}")
+        try:
+            # The current file is about to be replaced, not modified, so a hard link is a free copy
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+        for old in self.backups()[:-self.keep]:
+            os.remove(old)
+    
+    def backups(self):
+        # Oldest first; the timestamp in the name sorts chronologically
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = sorted(
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(self.base + '-') and os.path.splitext(name)[1] in EXTENSIONS.values()
+        )
+        return [os.path.join(self.backup_dir, name) for name in names]
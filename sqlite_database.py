@@ -0,0 +1,564 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from collections.abc import Mapping
+from datetime import datetime
+
+from message_map import MessageMap, SpillStore
+from search_index import UserSearch
+from snapshots import EXTENSIONS, snapshot_path
+
+logger = logging.getLogger(__name__)
+
+# Paged user listings: which users, and the column each order sorts on (id breaks ties).
+# The unary + keeps the planner off users_active so it walks the order index instead.
+USER_LISTINGS = {'active': '+is_active = 1', 'banned': 'id IN (SELECT id FROM banned)'}
+USER_ORDERS = {'joined': 'joined', 'name': 'name_key'}
+
+def name_key(name):
+    # Same folding as the JSON store; SQLite's own lower() only handles ASCII
+    return (name or '').lower()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    name TEXT,
+    joined TEXT NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    name_key TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS users_active ON users(is_active);
+CREATE INDEX IF NOT EXISTS users_joined ON users(joined, id);
+
+CREATE TABLE IF NOT EXISTS banned (
+    id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    plan_days INTEGER NOT NULL,
+    plan_price INTEGER NOT NULL,
+    screenshot TEXT,
+    time TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payments_pending ON payments(id) WHERE status = 'pending';
+
+CREATE TABLE IF NOT EXISTS cloned_bots (
+    user_id INTEGER PRIMARY KEY,
+    bot_token TEXT NOT NULL,
+    created TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    plan_days INTEGER NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    notified INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS cloned_bots_active ON cloned_bots(active);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    job TEXT NOT NULL
+);
+
+-- Targets handled since the job's last checkpoint, one row per send
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+
+-- Running counters for the stats panel, maintained by triggers in the same transaction
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO counters (name) VALUES ('total'), ('active'), ('banned'), ('pending_payments'), ('active_clones');
+
+CREATE TRIGGER IF NOT EXISTS users_insert AFTER INSERT ON users BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'total';
+    UPDATE counters SET value = value + NEW.is_active WHERE name = 'active';
+    UPDATE counters SET value = value + EXISTS (SELECT 1 FROM banned WHERE id = NEW.id) WHERE name = 'banned';
+END;
+CREATE TRIGGER IF NOT EXISTS users_active AFTER UPDATE OF is_active ON users BEGIN
+    UPDATE counters SET value = value + NEW.is_active - OLD.is_active WHERE name = 'active';
+END;
+CREATE TRIGGER IF NOT EXISTS banned_insert AFTER INSERT ON banned BEGIN
+    UPDATE counters SET value = value + EXISTS (SELECT 1 FROM users WHERE id = NEW.id) WHERE name = 'banned';
+END;
+CREATE TRIGGER IF NOT EXISTS banned_delete AFTER DELETE ON banned BEGIN
+    UPDATE counters SET value = value - EXISTS (SELECT 1 FROM users WHERE id = OLD.id) WHERE name = 'banned';
+END;
+CREATE TRIGGER IF NOT EXISTS payments_insert AFTER INSERT ON payments BEGIN
+    UPDATE counters SET value = value + (NEW.status = 'pending') WHERE name = 'pending_payments';
+END;
+CREATE TRIGGER IF NOT EXISTS payments_status AFTER UPDATE OF status ON payments BEGIN
+    UPDATE counters SET value = value + (NEW.status = 'pending') - (OLD.status = 'pending') WHERE name = 'pending_payments';
+END;
+CREATE TRIGGER IF NOT EXISTS cloned_bots_insert AFTER INSERT ON cloned_bots BEGIN
+    UPDATE counters SET value = value + NEW.active WHERE name = 'active_clones';
+END;
+CREATE TRIGGER IF NOT EXISTS cloned_bots_active AFTER UPDATE OF active ON cloned_bots BEGIN
+    UPDATE counters SET value = value + NEW.active - OLD.active WHERE name = 'active_clones';
+END;
+"""
+
+def user_row(row):
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'name': row['name'],
+        'joined': row['joined'],
+        'is_active': bool(row['is_active'])
+    }
+
+def payment_row(row):
+    return dict(row)
+
+def clone_row(row):
+    return {
+        'bot_token': row['bot_token'],
+        'created': row['created'],
+        'expires_at': row['expires_at'],
+        'plan_days': row['plan_days'],
+        'active': bool(row['active']),
+        'notified': bool(row['notified'])
+    }
+
+class UserView(Mapping):
+    # Read-only dict-like view over a filtered users query, rows are fetched on demand
+    def __init__(self, conn, where='1'):
+        self.conn = conn
+        self.where = where
+    
+    def __getitem__(self, key):
+        row = self.conn.execute(f"SELECT * FROM users WHERE id = ? AND {self.where}", (int(key),)).fetchone()
+        if not row:
+            raise KeyError(key)
+        return user_row(row)
+    
+    def __iter__(self):
+        for row in self.conn.execute(f"SELECT id FROM users WHERE {self.where}"):
+            yield str(row['id'])
+    
+    def __len__(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM users WHERE {self.where}").fetchone()[0]
+    
+    def items(self):
+        for row in self.conn.execute(f"SELECT * FROM users WHERE {self.where}"):
+            yield str(row['id']), user_row(row)
+    
+    def values(self):
+        for row in self.conn.execute(f"SELECT * FROM users WHERE {self.where}"):
+            yield user_row(row)
+
+class SQLiteDatabase:
+    # Used from the event loop only. Handlers run concurrently, but no method awaits, and
+    # read-then-write steps (payment settlement, job updates) finish inside one call.
+    def __init__(self, file='data.db', json_file='data.json'):
+        self.file = file
+        self.json_file = json_file
+        self.flush_stats = {'commits': 0, 'mutations': 0, 'last_batch': 0, 'max_batch': 0}
+        self.load()
+    
+    def load(self):
+        # sqlite3 keeps a per-connection cache of prepared statements keyed by SQL text
+        self.conn = sqlite3.connect(self.file, cached_statements=256)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrate_clones()
+        self.migrate_name_keys()
+        self.message_map = MessageMap(SpillStore(self.conn))
+        
+        if self.get_setting('greetings') is None:
+            self.migrate()
+        self.greetings = self.get_setting('greetings')
+        
+        # is_banned runs on every inbound message, keep it off the disk
+        self.banned = {row['id'] for row in self.conn.execute("SELECT id FROM banned")}
+        # Built on the first /find instead of on every startup
+        self.user_search = UserSearch(self.search_entries)
+        self.all_users = UserView(self.conn)
+        self.active_users = UserView(self.conn, 'is_active = 1')
+        self.banned_users = UserView(self.conn, 'id IN (SELECT id FROM banned)')
+        
+        counted = self.recount()
+        stored = self.get_stats()
+        if stored != counted:
+            logger.warning(f"⚠️ Stats drifted, recounted {stored} -> {counted}")
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE counters SET value = ? WHERE name = ?",
+                    ((value, name) for name, value in counted.items())
+                )
+    
+    def recount(self):
+        one = lambda sql: self.conn.execute(sql).fetchone()[0]
+        return {
+            'total': one("SELECT COUNT(*) FROM users"),
+            'active': one("SELECT COUNT(*) FROM users WHERE is_active = 1"),
+            'banned': one("SELECT COUNT(*) FROM users WHERE id IN (SELECT id FROM banned)"),
+            'pending_payments': one("SELECT COUNT(*) FROM payments WHERE status = 'pending'"),
+            'active_clones': one("SELECT COUNT(*) FROM cloned_bots WHERE active = 1")
+        }
+    
+    def get_stats(self):
+        return {row['name']: row['value'] for row in self.conn.execute("SELECT name, value FROM counters")}
+    
+    def migrate(self):
+        from database import Database, DEFAULT_GREETINGS
+        
+        data = None
+        # The json store may have been kept in either snapshot format
+        if any(os.path.exists(snapshot_path(self.json_file, fmt)) for fmt in EXTENSIONS):
+            legacy = Database(self.json_file, backend='json')
+            data = legacy.data
+            with legacy.message_map.spill.lock:
+                mapped = legacy.message_map.spill.conn.execute(
+                    "SELECT owner_msg_id, user_id, ts FROM message_map"
+                ).fetchall()
+            legacy.message_map.spill.close()
+        
+        with self.conn:
+            if data:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO users (id, username, name, joined, is_active, name_key) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((u['id'], u.get('username'), u.get('name'), u['joined'], int(u.get('is_active', True)),
+                      name_key(u.get('name')))
+                     for u in data['users'].values())
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO banned (id) VALUES (?)",
+                    ((uid,) for uid in data['banned'])
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO payments (id, user_id, plan_days, plan_price, screenshot, time, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((p['id'], p['user_id'], p['plan_days'], p['plan_price'], p['screenshot'], p['time'], p['status'])
+                     for p in data['pending_payments'].values())
+                )
+                if os.path.exists(legacy.archive_file):
+                    with open(legacy.archive_file) as f:
+                        self.conn.executemany(
+                            "INSERT OR IGNORE INTO payments (id, user_id, plan_days, plan_price, screenshot, time, status) "
+                            "VALUES (:id, :user_id, :plan_days, :plan_price, :screenshot, :time, :status)",
+                            (json.loads(line) for line in f if line.strip())
+                        )
+                # Never hand out an id the JSON store already used
+                if not self.conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'payments'", (data['payment_seq'],)
+                ).rowcount:
+                    self.conn.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES ('payments', ?)", (data['payment_seq'],)
+                    )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO cloned_bots (user_id, bot_token, created, expires_at, plan_days, active, notified) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((int(uid), c['bot_token'], c['created'], c['expires_at'], c['plan_days'], int(c['active']),
+                      int(c['notified']))
+                     for uid, c in data['cloned_bots'].items())
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO message_map (owner_msg_id, user_id, ts) VALUES (?, ?, ?)",
+                    mapped
+                )
+                self.set_setting('paid_batches_text', data['paid_batches_text'])
+                self.set_setting('greetings', data['greetings'])
+                logger.info(f"📦 Migrated {len(data['users'])} users from {self.json_file}")
+            else:
+                self.set_setting('paid_batches_text', 'No batches available yet.')
+                self.set_setting('greetings', DEFAULT_GREETINGS)
+    
+    def migrate_name_keys(self):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(users)")]
+        if 'name_key' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE users ADD COLUMN name_key TEXT NOT NULL DEFAULT ''")
+                self.conn.executemany(
+                    "UPDATE users SET name_key = ? WHERE id = ?",
+                    [(name_key(row['name']), row['id']) for row in self.conn.execute("SELECT id, name FROM users")]
+                )
+        # Range scans need a plain column; row values over an expression or COLLATE fall back to a full scan
+        self.conn.execute("CREATE INDEX IF NOT EXISTS users_name ON users(name_key, id)")
+    
+    def migrate_clones(self):
+        # Expiry used to be an ISO string parsed on every lookup, keep it as epoch seconds
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(cloned_bots)")]
+        if 'expiry' not in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE cloned_bots ADD COLUMN expires_at REAL NOT NULL DEFAULT 0")
+            self.conn.execute("ALTER TABLE cloned_bots ADD COLUMN notified INTEGER NOT NULL DEFAULT 0")
+            self.conn.executemany(
+                "UPDATE cloned_bots SET expires_at = ? WHERE user_id = ?",
+                [(datetime.fromisoformat(row['expiry']).timestamp(), row['user_id'])
+                 for row in self.conn.execute("SELECT user_id, expiry FROM cloned_bots")]
+            )
+            self.conn.execute("ALTER TABLE cloned_bots DROP COLUMN expiry")
+    
+    def get_setting(self, key):
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+    
+    def set_setting(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (key, json.dumps(value))
+        )
+    
+    def start_writer(self):
+        # Every statement is committed as it runs; WAL keeps that cheap
+        pass
+    
+    def flush(self):
+        return 0
+    
+    def queue_depth(self):
+        return len(self.message_map.dirty)
+    
+    async def close(self):
+        self.message_map.flush()
+        self.conn.close()
+    
+    def add_user(self, uid, username, fname):
+        with self.conn:
+            added = self.conn.execute(
+                "INSERT OR IGNORE INTO users (id, username, name, joined, is_active, name_key) VALUES (?, ?, ?, ?, 1, ?)",
+                (uid, username, fname, datetime.now().isoformat(), name_key(fname))
+            ).rowcount
+        if added:
+            self.user_search.add(uid, fname, username)
+    
+    def get_user(self, uid):
+        row = self.conn.execute("SELECT * FROM users WHERE id = ?", (int(uid),)).fetchone()
+        return user_row(row) if row else None
+    
+    def get_all_users(self):
+        return self.all_users
+    
+    def get_active_users(self):
+        return self.active_users
+    
+    def get_banned_users(self):
+        return self.banned_users
+    
+    def ban_user(self, uid):
+        if uid not in self.banned:
+            with self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO banned (id) VALUES (?)", (uid,))
+                self.conn.execute("UPDATE users SET is_active = 0 WHERE id = ?", (uid,))
+            self.banned.add(uid)
+    
+    def unban_user(self, uid):
+        if uid in self.banned:
+            with self.conn:
+                self.conn.execute("DELETE FROM banned WHERE id = ?", (uid,))
+                self.conn.execute("UPDATE users SET is_active = 1 WHERE id = ?", (uid,))
+            self.banned.discard(uid)
+    
+    def is_banned(self, uid):
+        return uid in self.banned
+    
+    def search_entries(self):
+        # Read in the worker thread through a connection of its own; WAL lets it run beside writes
+        conn = sqlite3.connect(self.file, check_same_thread=False)
+        try:
+            yield from conn.execute("SELECT id, name, username FROM users")
+        finally:
+            conn.close()
+    
+    async def search_users(self, query, limit=10):
+        return await self.user_search.search(query, limit, self.get_user)
+    
+    def get_user_page(self, listing, order, cursor=None, backward=False, limit=20):
+        # Keyset pagination: the cursor user's sort key bounds the next query, nothing is OFFSET-scanned
+        where = USER_LISTINGS[listing]
+        column = USER_ORDERS[order]
+        select = f"SELECT * FROM users WHERE {where} AND ({column}, id) {{}} (?, ?) ORDER BY {column} {{}}, id {{}} LIMIT ?"
+        
+        bound = None
+        if cursor is not None:
+            row = self.conn.execute(f"SELECT {column}, id FROM users WHERE id = ?", (cursor,)).fetchone()
+            bound = tuple(row) if row else None
+        
+        rows = []
+        if bound and backward:
+            rows = self.conn.execute(select.format('<', 'DESC', 'DESC'), (*bound, limit)).fetchall()[::-1]
+        elif bound:
+            rows = self.conn.execute(select.format('>', 'ASC', 'ASC'), (*bound, limit)).fetchall()
+        if len(rows) < limit and (not bound or backward):
+            # First page, or a backward step that ran into the start
+            rows = self.conn.execute(
+                f"SELECT * FROM users WHERE {where} ORDER BY {column}, id LIMIT ?", (limit,)
+            ).fetchall()
+        if not rows:
+            return [], False, False
+        
+        exists = f"SELECT EXISTS (SELECT 1 FROM users WHERE {where} AND ({column}, id) {{}} (?, ?))"
+        has_prev = self.conn.execute(exists.format('<'), (rows[0][column], rows[0]['id'])).fetchone()[0]
+        has_next = self.conn.execute(exists.format('>'), (rows[-1][column], rows[-1]['id'])).fetchone()[0]
+        return [user_row(row) for row in rows], bool(has_prev), bool(has_next)
+    
+    def add_pending_payment(self, user_id, plan_days, plan_price, screenshot):
+        payment = {
+            'user_id': user_id,
+            'plan_days': plan_days,
+            'plan_price': plan_price,
+            'screenshot': screenshot,
+            'time': datetime.now().isoformat(),
+            'status': 'pending'
+        }
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO payments (user_id, plan_days, plan_price, screenshot, time, status) "
+                "VALUES (:user_id, :plan_days, :plan_price, :screenshot, :time, :status)",
+                payment
+            )
+        return {'id': cur.lastrowid, **payment}
+    
+    def get_pending_payments(self):
+        rows = self.conn.execute("SELECT * FROM payments WHERE status = 'pending' ORDER BY id")
+        return [payment_row(row) for row in rows]
+    
+    def approve_payment(self, payment_id):
+        with self.conn:
+            if not self.conn.execute(
+                "UPDATE payments SET status = 'approved' WHERE id = ? AND status = 'pending'", (payment_id,)
+            ).rowcount:
+                return None
+        row = self.conn.execute("SELECT * FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        return payment_row(row)
+    
+    def reject_payment(self, payment_id):
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE payments SET status = 'rejected' WHERE id = ? AND status = 'pending'", (payment_id,)
+            ).rowcount > 0
+    
+    def add_cloned_bot(self, user_id, bot_token, plan_days):
+        clone = {
+            'bot_token': bot_token,
+            'created': datetime.now().isoformat(),
+            'expires_at': time.time() + plan_days * 86400,
+            'plan_days': plan_days,
+            'active': True,
+            'notified': False
+        }
+        with self.conn:
+            # Upsert rather than REPLACE so the counter triggers see an UPDATE, not a silent delete
+            self.conn.execute(
+                "INSERT INTO cloned_bots (user_id, bot_token, created, expires_at, plan_days, active, notified) "
+                "VALUES (?, ?, ?, ?, ?, 1, 0) "
+                "ON CONFLICT (user_id) DO UPDATE SET bot_token = excluded.bot_token, created = excluded.created, "
+                "expires_at = excluded.expires_at, plan_days = excluded.plan_days, active = 1, notified = 0",
+                (user_id, bot_token, clone['created'], clone['expires_at'], plan_days)
+            )
+        return clone
+    
+    def get_cloned_bot(self, user_id):
+        # Deactivation is the expiry scheduler's job, a lookup never writes
+        row = self.conn.execute(
+            "SELECT * FROM cloned_bots WHERE user_id = ? AND active = 1 AND expires_at > ?", (user_id, time.time())
+        ).fetchone()
+        return clone_row(row) if row else None
+    
+    def deactivate_clone(self, user_id, expires_at):
+        # expires_at guards against a renewal that landed after the expiry was scheduled
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE cloned_bots SET active = 0 WHERE user_id = ? AND active = 1 AND expires_at = ?",
+                (user_id, expires_at)
+            ).rowcount > 0
+    
+    def mark_clone_notified(self, user_id):
+        with self.conn:
+            self.conn.execute("UPDATE cloned_bots SET notified = 1 WHERE user_id = ?", (user_id,))
+    
+    def get_cloned_bots(self):
+        return {str(row['user_id']): clone_row(row) for row in self.conn.execute("SELECT * FROM cloned_bots")}
+    
+    def map_messages(self, user_id, owner_msg_ids):
+        for owner_msg_id in owner_msg_ids:
+            self.message_map.put(owner_msg_id, user_id)
+        self.message_map.flush()
+    
+    def get_user_from_msg(self, owner_msg_id):
+        return self.message_map.get(owner_msg_id)
+    
+    def get_random_greeting(self):
+        return random.choice(self.greetings)
+    
+    def set_paid_batches(self, text):
+        with self.conn:
+            self.set_setting('paid_batches_text', text)
+    
+    def get_paid_batches(self):
+        return self.get_setting('paid_batches_text')
+    
+    def add_broadcast_job(self, from_chat_id, message_id, targets, status_message_id=None, media=None):
+        job = {
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'media': media,
+            'status_message_id': status_message_id,
+            'targets': targets,
+            'cursor': 0,
+            'done_ahead': [],
+            'counts': {'sent': 0, 'blocked': 0, 'deactivated': 0, 'failed': 0},
+            'status': 'running',
+            'created': datetime.now().isoformat()
+        }
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO broadcast_jobs (status, job) VALUES (?, ?)", (job['status'], json.dumps(job))
+            )
+            job['id'] = cur.lastrowid
+            self.conn.execute("UPDATE broadcast_jobs SET job = ? WHERE id = ?", (json.dumps(job), job['id']))
+        return job
+    
+    def update_broadcast_job(self, job_id, **fields):
+        job = self.get_broadcast_job(job_id)
+        if not job:
+            return
+        job.update(fields)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE broadcast_jobs SET status = ?, job = ? WHERE id = ?",
+                (job['status'], json.dumps(job), job_id)
+            )
+    
+    def get_broadcast_job(self, job_id):
+        row = self.conn.execute("SELECT job FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row['job']) if row else None
+    
+    def get_broadcast_jobs(self):
+        return [json.loads(row['job']) for row in self.conn.execute("SELECT job FROM broadcast_jobs ORDER BY id")]
+    
+    def record_broadcast_delivery(self, job_id, index, outcome):
+        # A small row per send instead of rewriting the job with its whole target list
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO broadcast_deliveries (job_id, idx, outcome) VALUES (?, ?, ?)",
+                (job_id, index, outcome)
+            )
+    
+    def get_broadcast_deliveries(self, job_id):
+        rows = self.conn.execute("SELECT idx, outcome FROM broadcast_deliveries WHERE job_id = ?", (job_id,))
+        return [(row['idx'], row['outcome']) for row in rows]
+    
+    def clear_broadcast_deliveries(self, job_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM broadcast_deliveries WHERE job_id = ?", (job_id,))
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # database.py opens a default store in the working directory on import, so modules
+    # that pull it in are imported inside the tests, after this has moved somewhere disposable
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture(params=['json', 'journal', 'sqlite'])
+def open_store(request, tmp_path):
+    # Opens, or reopens, the same store in tmp_path; tests using it run once per backend
+    def open_store():
+        if request.param == 'sqlite':
+            from sqlite_database import SQLiteDatabase
+            return SQLiteDatabase(str(tmp_path / 'data.db'), str(tmp_path / 'data.json'))
+        from database import Database
+        return Database(str(tmp_path / 'data.json'), backend=request.param)
+    return open_store
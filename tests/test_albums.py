@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+from albums import AlbumCollector
+
+def item(message_id, chat_id=1, group='g1'):
+    return SimpleNamespace(chat_id=chat_id, message_id=message_id, media_group_id=group)
+
+def update(msg):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=msg.chat_id), message=msg)
+
+def collector():
+    return AlbumCollector(SimpleNamespace(create_task=asyncio.ensure_future), window=0.02)
+
+def test_items_are_sent_together_in_message_order():
+    sent = []
+    
+    async def send_album(messages):
+        sent.append([m.message_id for m in messages])
+    
+    async def scenario():
+        albums = collector()
+        albums.start(item(11), send_album)
+        assert albums.join(item(13))
+        assert albums.join(item(12))
+        # Another album, or no album at all, doesn't join this one
+        assert not albums.join(item(20, group='g2'))
+        assert not albums.join(item(21, group=None))
+        await asyncio.sleep(0.1)
+        return albums
+    
+    albums = asyncio.run(scenario())
+    assert sent == [[11, 12, 13]]
+    assert not albums.pending and not albums.chats
+
+def test_later_updates_wait_for_the_album():
+    order = []
+    
+    async def send_album(messages):
+        await asyncio.sleep(0.05)
+        order.append('album')
+    
+    async def later(albums, msg):
+        await albums.hold(update(msg))
+        order.append(msg.message_id)
+    
+    async def scenario():
+        albums = collector()
+        albums.start(item(1), send_album)
+        # Items of the album still collecting pass straight through to join it
+        await asyncio.wait_for(albums.hold(update(item(2))), 0.01)
+        await asyncio.gather(later(albums, item(3, group=None)), later(albums, item(4, chat_id=2, group=None)))
+    
+    asyncio.run(scenario())
+    # The other chat was never held
+    assert order == [4, 'album', 3]
@@ -0,0 +1,47 @@
+import asyncio
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+    
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.sent.append(chat_id)
+
+def test_resume_skips_exactly_the_recorded_sends(open_store):
+    from broadcast import Broadcast
+    db = open_store()
+    job = db.add_broadcast_job(1, 10, list(range(100, 110)))
+    
+    # Delivered out of order, then the process dies before any checkpoint
+    broadcast = Broadcast(FakeBot(), job, db, {})
+    for index, outcome in [(0, 'sent'), (1, 'blocked'), (4, 'sent')]:
+        broadcast.complete(index, outcome)
+    
+    db = open_store()
+    job = db.get_broadcast_job(job['id'])
+    assert job['cursor'] == 0
+    bot = FakeBot()
+    broadcast = Broadcast(bot, job, db, {job['id']: None})
+    assert (broadcast.cursor, broadcast.done_ahead) == (2, {4})
+    
+    counts = asyncio.run(broadcast.run())
+    assert sorted(bot.sent) == [102, 103, 105, 106, 107, 108, 109]
+    assert counts == {'sent': 9, 'blocked': 1, 'deactivated': 0, 'failed': 0}
+    
+    # The finished job's checkpoint covers everything, its delivery records are gone
+    db = open_store()
+    assert db.get_broadcast_job(job['id'])['status'] == 'done'
+    assert db.get_broadcast_deliveries(job['id']) == []
+
+def test_torn_delivery_record_is_skipped(tmp_path):
+    from database import Database
+    db = Database(str(tmp_path / 'data.json'), backend='journal')
+    db.record_broadcast_delivery(1, 0, 'sent')
+    db.delivery_logs.pop(1).close()
+    # What a crash halfway through a write leaves behind
+    with open(db.delivery_file(1), 'a') as f:
+        f.write('1 se')
+    assert db.get_broadcast_deliveries(1) == [(0, 'sent')]
+    
+    db.record_broadcast_delivery(1, 2, 'failed')
+    assert db.get_broadcast_deliveries(1) == [(0, 'sent'), (2, 'failed')]
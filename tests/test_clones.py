@@ -0,0 +1,30 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+class FakeJobQueue:
+    def __init__(self):
+        self.armed = []
+    
+    def run_once(self, callback, when, name=None):
+        self.armed.append(when)
+        return SimpleNamespace(schedule_removal=lambda: None)
+
+class BrokenDB:
+    def get_cloned_bot(self, user_id):
+        raise KeyError(user_id)
+
+def test_failed_entry_does_not_stop_the_scheduler():
+    from clones import ExpiryScheduler
+    scheduler = ExpiryScheduler(SimpleNamespace(main_db=BrokenDB()))
+    job_queue = FakeJobQueue()
+    scheduler.start(job_queue)
+    now = time.time()
+    scheduler.heap = [(now - 2, 1, now, 'notice'), (now - 1, 2, now, 'notice'), (now + 3600, 3, now + 3600, 'expire')]
+    
+    asyncio.run(scheduler.fire(SimpleNamespace(bot=None)))
+    
+    # Both due entries were tried and the next one is armed
+    assert [entry[1] for entry in scheduler.heap] == [3]
+    assert scheduler.job is not None
+    assert job_queue.armed and job_queue.armed[-1] > 3000
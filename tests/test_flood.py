@@ -0,0 +1,37 @@
+from flood import ALLOW, DROP, MUTE, WARN, FloodControl
+
+def test_burst_then_warn_once_then_drop():
+    flood = FloodControl(burst=3, rate=1, mute=0)
+    verdicts = [flood.check(1, now=0) for _ in range(6)]
+    assert verdicts == [ALLOW, ALLOW, ALLOW, WARN, DROP, DROP]
+    assert flood.dropped == 3
+
+def test_tokens_refill_at_the_rate():
+    flood = FloodControl(burst=2, rate=0.5, mute=0)
+    assert [flood.check(1, now=0) for _ in range(3)] == [ALLOW, ALLOW, WARN]
+    assert flood.check(1, now=1) == DROP
+    # Two seconds buy one message, and a new streak warns again
+    assert flood.check(1, now=2) == ALLOW
+    assert flood.check(1, now=2) == WARN
+
+def test_users_have_separate_buckets():
+    flood = FloodControl(burst=1, rate=1, mute=0)
+    assert flood.check(1, now=0) == ALLOW
+    assert flood.check(1, now=0) == WARN
+    assert flood.check(2, now=0) == ALLOW
+
+def test_mute_after_a_streak_of_drops():
+    flood = FloodControl(burst=1, rate=1, mute=60, mute_after=3)
+    assert [flood.check(1, now=0) for _ in range(4)] == [ALLOW, WARN, DROP, MUTE]
+    # Muted: refilled tokens don't help until the mute runs out
+    assert flood.check(1, now=30) == DROP
+    assert flood.check(1, now=61) == ALLOW
+
+def test_idle_buckets_are_evicted():
+    flood = FloodControl(burst=2, rate=1, mute=0)
+    flood.check(1, now=0)
+    flood.check(2, now=1)
+    assert len(flood) == 2
+    # User 1 has been idle long enough to be full again, user 2 not yet
+    flood.check(3, now=2.5)
+    assert list(flood.buckets) == [2, 3]
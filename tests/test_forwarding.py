@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+@pytest.fixture
+def handlers(monkeypatch):
+    import user_handlers
+    monkeypatch.setattr(user_handlers, 'FORWARD_MODE', 'single')
+    return user_handlers
+
+class FakeBot:
+    def __init__(self, reject=None):
+        # reject: error raised by the first send that carries the header with the content
+        self.reject = reject
+        self.sent = []
+    
+    async def call(self, method, **kwargs):
+        self.sent.append((method, kwargs))
+        if self.reject and 'New Message' in (kwargs.get('text') or kwargs.get('caption') or ''):
+            error, self.reject = self.reject, None
+            raise error
+        return SimpleNamespace(message_id=len(self.sent))
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self.call('send_message', chat_id=chat_id, text=text)
+    
+    async def copy_message(self, chat_id, from_chat_id, message_id, caption=None, **kwargs):
+        return await self.call('copy_message', chat_id=chat_id, caption=caption)
+
+def message(text=None, caption=None, photo=None):
+    replies = []
+    
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+    
+    return SimpleNamespace(
+        chat_id=1000, message_id=7, text=text, caption=caption, photo=photo,
+        video=None, document=None, audio=None, animation=None, voice=None,
+        reply_text=reply_text, replies=replies
+    )
+
+def forward(handlers, bot, msg, tmp_path):
+    from database import Database
+    db = Database(str(tmp_path / 'data.json'), backend='journal')
+    context = SimpleNamespace(bot=bot, bot_data={'OWNER_ID': 1, 'db': db})
+    user = SimpleNamespace(id=1000, first_name="User", username="user")
+    asyncio.run(handlers.forward_messages(context, user, [msg]))
+    return db
+
+def test_utf16_len_counts_astral_characters_twice(handlers):
+    assert handlers.utf16_len("abc") == 3
+    assert handlers.utf16_len("é") == 1
+    assert handlers.utf16_len("😀") == 2
+
+def test_emoji_text_under_4096_code_points_is_split(handlers, tmp_path):
+    # 4000 code points, but twice that in UTF-16 - far too long once the header is on
+    msg = message(text="😀" * 4000)
+    bot = FakeBot()
+    forward(handlers, bot, msg, tmp_path)
+    
+    methods = [method for method, _ in bot.sent]
+    assert methods == ['send_message', 'copy_message', 'send_message']
+    assert bot.sent[0][1]['text'].endswith("Content below:")
+    assert not msg.replies
+
+def test_short_text_goes_out_in_one_call(handlers, tmp_path):
+    msg = message(text="hello")
+    bot = FakeBot()
+    forward(handlers, bot, msg, tmp_path)
+    
+    assert [method for method, _ in bot.sent] == ['send_message', 'send_message']
+    assert bot.sent[0][1]['text'].endswith("hello")
+
+def test_too_long_from_telegram_falls_back_to_split(handlers, tmp_path):
+    msg = message(caption="a photo", photo=[SimpleNamespace(file_id='p')])
+    bot = FakeBot(reject=BadRequest("Message caption is too long"))
+    db = forward(handlers, bot, msg, tmp_path)
+    
+    # The rejected single call, then header and copy, then the greeting
+    assert [method for method, _ in bot.sent] == ['copy_message', 'send_message', 'copy_message', 'send_message']
+    assert not msg.replies
+    assert db.get_user_from_msg(3) == 1000
+
+def test_other_bad_requests_still_fail_the_forward(handlers, tmp_path):
+    msg = message(text="hello")
+    bot = FakeBot(reject=BadRequest("Chat not found"))
+    forward(handlers, bot, msg, tmp_path)
+    
+    assert len(bot.sent) == 1
+    assert msg.replies == ["❌ Failed to send message."]
+
+class BrokenBot(FakeBot):
+    async def call(self, method, **kwargs):
+        self.sent.append((method, kwargs))
+        raise RuntimeError("connection reset")
+
+def test_failed_queued_forward_still_notifies_the_user(handlers, tmp_path):
+    from database import Database
+    db = Database(str(tmp_path / 'data.json'), backend='journal')
+    context = SimpleNamespace(bot=BrokenBot(), bot_data={'OWNER_ID': 1, 'db': db})
+    user = SimpleNamespace(id=1000, first_name="User", username="user")
+    msg = message(text="hello")
+    
+    async def scenario():
+        queue = handlers.ForwardQueue(None)
+        queue.submit(user.id, handlers.forward_messages(context, user, [msg]))
+        await queue.stop()
+    
+    asyncio.run(scenario())
+    assert msg.replies == ["❌ Failed to send message."]
+
+def test_shutdown_drops_forwards_that_outlast_the_timeout(handlers, caplog):
+    started = []
+    
+    async def forward(n):
+        started.append(n)
+        await asyncio.sleep(60)
+    
+    async def scenario():
+        queue = handlers.ForwardQueue(None)
+        for n in range(3):
+            queue.submit(1000, forward(n))
+        await queue.stop(timeout=0.05)
+        return queue
+    
+    queue = asyncio.run(scenario())
+    # One user's forwards run one at a time: the first was cut short, the rest never began
+    assert started == [0]
+    assert not queue.tasks and not queue.users
+    assert "Dropped 3 forward(s)" in caplog.text
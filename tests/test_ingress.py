@@ -0,0 +1,63 @@
+import asyncio
+
+from telegram import Update
+
+from ingress import ChatOrderedProcessor
+
+def message(update_id, chat_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+            'text': 'hi'
+        }
+    }, None)
+
+def run(processor, updates, handle):
+    async def scenario():
+        await asyncio.gather(*(
+            processor.process_update(update, handle(update)) for update in updates
+        ))
+    asyncio.run(scenario())
+
+def test_one_chat_runs_in_arrival_order():
+    processor = ChatOrderedProcessor(8)
+    finished = []
+    
+    async def handle(update):
+        # Earlier updates are the slow ones; without the chat lock they would finish last
+        await asyncio.sleep(0.05 - update.update_id * 0.01)
+        finished.append(update.update_id)
+    
+    run(processor, [message(i, 1) for i in range(5)], handle)
+    assert finished == [0, 1, 2, 3, 4]
+    assert not processor.chats
+
+def test_a_slow_chat_does_not_hold_up_the_others():
+    processor = ChatOrderedProcessor(2)
+    finished = []
+    
+    async def handle(update):
+        await asyncio.sleep(0.1 if update.effective_chat.id == 1 else 0)
+        finished.append(update.effective_chat.id)
+    
+    # Chat 1's backlog waits on its own lock, not on the two slots
+    run(processor, [message(i, 1) for i in range(3)] + [message(10 + i, 2 + i) for i in range(3)], handle)
+    assert finished == [2, 3, 4, 1, 1, 1]
+
+def test_hold_runs_in_the_updates_turn():
+    processor = ChatOrderedProcessor(8)
+    events = []
+    
+    async def hold(update):
+        events.append(('hold', update.update_id))
+    
+    async def handle(update):
+        events.append(('handle', update.update_id))
+    
+    processor.hold = hold
+    run(processor, [message(1, 1), message(2, 1)], handle)
+    assert events == [('hold', 1), ('handle', 1), ('hold', 2), ('handle', 2)]
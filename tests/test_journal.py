@@ -0,0 +1,36 @@
+import os
+
+def open_store(path):
+    # Imported here: database.py opens a default store in the working directory, which
+    # conftest.py has moved to the test's tmp_path by now
+    from database import Database
+    return Database(str(path), backend='journal')
+
+def tear(path, mode='a'):
+    # What a crash halfway through append_journal leaves behind
+    with open(str(path) + '.journal', mode) as f:
+        f.write('[["set",["users","99"],{"id":99,"user')
+
+def test_replay_keeps_records_before_a_torn_line(tmp_path):
+    path = tmp_path / 'data.json'
+    db = open_store(path)
+    db.add_user(1, 'one', 'One')
+    db.add_user(2, 'two', 'Two')
+    tear(path)
+    
+    db = open_store(path)
+    assert sorted(db.data['users']) == ['1', '2']
+    assert not os.path.exists(str(path) + '.journal')
+
+def test_torn_first_line_does_not_swallow_later_records(tmp_path):
+    path = tmp_path / 'data.json'
+    open_store(path)
+    # The first record since the last compaction is the torn one
+    tear(path, 'w')
+    
+    db = open_store(path)
+    assert db.data['users'] == {}
+    db.add_user(3, 'three', 'Three')
+    
+    db = open_store(path)
+    assert list(db.data['users']) == ['3']
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from outbound import BROADCAST, FORWARD, INTERACTIVE, OutboundScheduler
+
+def send(scheduler, log, chat_id, priority=INTERACTIVE, label=None):
+    async def callback():
+        log.append((label or chat_id, time.monotonic()))
+        return label
+    
+    return scheduler.process_request(callback, (), {}, 'sendMessage', {'chat_id': chat_id}, priority)
+
+async def started(**limits):
+    scheduler = OutboundScheduler(**limits)
+    await scheduler.initialize()
+    return scheduler
+
+def test_chat_burst_then_chat_rate():
+    log = []
+    
+    async def scenario():
+        scheduler = await started(rate=1000, chat_rate=20, chat_burst=2)
+        await asyncio.gather(*(send(scheduler, log, 1) for _ in range(4)))
+        await scheduler.shutdown()
+    
+    asyncio.run(scenario())
+    times = [t - log[0][1] for _, t in log]
+    # Two at once, then one every 1/20 s
+    assert times[1] < 0.02
+    assert 0.03 < times[2] < 0.1
+    assert 0.08 < times[3] < 0.15
+
+def test_higher_priority_goes_first():
+    log = []
+    
+    async def scenario():
+        scheduler = await started(rate=1000, chat_rate=1000, chat_burst=1000)
+        scheduler.pause(0.05)
+        sends = [
+            send(scheduler, log, 1, BROADCAST, 'broadcast'),
+            send(scheduler, log, 2, FORWARD, 'forward'),
+            send(scheduler, log, 3, INTERACTIVE, 'interactive')
+        ]
+        await asyncio.gather(*sends)
+        await scheduler.shutdown()
+    
+    asyncio.run(scenario())
+    assert [label for label, _ in log] == ['interactive', 'forward', 'broadcast']
+
+def test_a_limited_chat_does_not_block_others():
+    log = []
+    
+    async def scenario():
+        scheduler = await started(rate=1000, chat_rate=5, chat_burst=1)
+        await asyncio.gather(*(send(scheduler, log, 1) for _ in range(2)), send(scheduler, log, 2))
+        await scheduler.shutdown()
+    
+    asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in log] == [1, 2, 1]
+
+def test_retry_after_pauses_and_retries():
+    attempts = []
+    
+    async def callback():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(1)
+        return 'ok'
+    
+    async def scenario():
+        scheduler = await started(rate=1000, chat_rate=1000, chat_burst=1000)
+        # RetryAfter carries whole seconds; shorten the pause it causes
+        scheduler.pause = lambda seconds: OutboundScheduler.pause(scheduler, seconds / 20)
+        result = await scheduler.process_request(callback, (), {}, 'sendMessage', {'chat_id': 1}, None)
+        await scheduler.shutdown()
+        return result
+    
+    assert asyncio.run(scenario()) == 'ok'
+    assert attempts[1] - attempts[0] >= 0.04
@@ -0,0 +1,52 @@
+def walk(db, listing, order, limit):
+    # Forward through every page, then back again from the last one
+    pages = []
+    page, has_prev, has_next = db.get_user_page(listing, order, limit=limit)
+    assert not has_prev
+    pages.append([u['id'] for u in page])
+    while has_next:
+        page, has_prev, has_next = db.get_user_page(listing, order, cursor=page[-1]['id'], limit=limit)
+        assert has_prev
+        pages.append([u['id'] for u in page])
+    
+    back = [pages[-1]]
+    while has_prev:
+        page, has_prev, has_next = db.get_user_page(listing, order, cursor=page[0]['id'], backward=True, limit=limit)
+        assert has_next
+        back.append([u['id'] for u in page])
+    return pages, back[::-1]
+
+def filled(open_store):
+    db = open_store()
+    # Names out of id order, with case differences and a tie
+    names = ["delta", "Alpha", "charlie", "bravo", "alpha"]
+    for uid in range(1, 24):
+        db.add_user(uid, None, f"{names[uid % len(names)]} {uid // len(names)}")
+    for uid in (4, 9, 16):
+        db.ban_user(uid)
+    return db
+
+def test_pages_cover_the_listing_in_order(open_store):
+    db = filled(open_store)
+    active = [uid for uid in range(1, 24) if uid not in (4, 9, 16)]
+    
+    pages, back = walk(db, 'active', 'joined', 6)
+    assert [uid for page in pages for uid in page] == active
+    assert [len(page) for page in pages] == [6, 6, 6, 2]
+    assert back == pages
+    
+    pages, back = walk(db, 'active', 'name', 6)
+    by_name = sorted(active, key=lambda uid: (db.get_user(uid)['name'].lower(), uid))
+    assert [uid for page in pages for uid in page] == by_name
+    assert back == pages
+
+def test_banned_listing(open_store):
+    db = filled(open_store)
+    pages, _ = walk(db, 'banned', 'joined', 2)
+    assert pages == [[4, 9], [16]]
+
+def test_unknown_cursor_starts_over(open_store):
+    db = filled(open_store)
+    first, _, _ = db.get_user_page('active', 'joined', limit=5)
+    page, has_prev, _ = db.get_user_page('active', 'joined', cursor=999, limit=5)
+    assert page == first and not has_prev
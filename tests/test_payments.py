@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+@pytest.fixture(params=['json', 'journal'])
+def store(request, tmp_path):
+    from database import Database
+    return Database(str(tmp_path / 'data.json'), backend=request.param)
+
+def archived(store):
+    try:
+        with open(store.archive_file) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+def test_settled_payment_is_archived_after_its_deletion_is_written(store, monkeypatch):
+    import database
+    monkeypatch.setattr(database, 'WRITE_BEHIND', True)
+    payment = store.add_pending_payment(5, 7, 12, 'shot')
+    
+    async def scenario():
+        store.start_writer()
+        store.approve_payment(payment['id'])
+        # Nothing flushed yet: a crash now leaves the payment pending and unarchived
+        assert archived(store) == []
+        await store.close()
+    
+    asyncio.run(scenario())
+    assert [p['id'] for p in archived(store)] == [payment['id']]
+    
+    from database import Database
+    reopened = Database(store.file, backend=store.backend)
+    assert reopened.get_pending_payments() == []
+
+def test_payment_ids_keep_counting_across_restarts(open_store):
+    db = open_store()
+    first = db.add_pending_payment(5, 7, 12, 'shot')
+    second = db.add_pending_payment(6, 30, 25, 'shot')
+    assert second['id'] == first['id'] + 1
+    db.reject_payment(second['id'])
+    
+    db = open_store()
+    assert db.add_pending_payment(7, 1, 2, 'shot')['id'] == second['id'] + 1
+
+def test_a_payment_settles_once(open_store):
+    db = open_store()
+    payment = db.add_pending_payment(5, 7, 12, 'shot')
+    other = db.add_pending_payment(6, 30, 25, 'shot')
+    assert db.get_stats()['pending_payments'] == 2
+    
+    approved = db.approve_payment(payment['id'])
+    assert (approved['id'], approved['status'], approved['plan_days']) == (payment['id'], 'approved', 7)
+    assert db.approve_payment(payment['id']) is None
+    assert db.reject_payment(payment['id']) is False
+    assert db.reject_payment(other['id']) is True
+    assert db.get_pending_payments() == []
+    assert db.get_stats()['pending_payments'] == 0
+    
+    db = open_store()
+    assert db.get_pending_payments() == []
+    assert db.approve_payment(other['id']) is None
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from router import CallbackRouter, choice
+
+def make_router():
+    router = CallbackRouter()
+    calls = []
+    
+    def record(name):
+        async def handler(update, context, *payload):
+            calls.append((name, payload))
+        return handler
+    
+    router.route('ban', int)(record('ban'))
+    router.route('owner_ban')(record('owner_ban'))
+    router.route('job_pause', int)(record('job_pause'))
+    router.route('list', choice('active', 'banned'), int)(record('list'))
+    return router, calls
+
+def test_longest_route_wins():
+    router, _ = make_router()
+    assert router.resolve('owner_ban')[0] == 'owner_ban'
+    assert router.resolve('ban_42')[0] == 'ban'
+    assert router.resolve('job_pause_7')[0] == 'job_pause'
+
+def test_payload_is_converted_by_the_schema():
+    router, _ = make_router()
+    assert router.resolve('ban_42')[2] == [42]
+    assert router.resolve('list_banned_3')[2] == ['banned', 3]
+
+def test_bad_payloads_resolve_to_nothing():
+    router, _ = make_router()
+    for data in ('ban', 'ban_x', 'ban_1_2', 'list_all_1', 'unknown', ''):
+        assert router.resolve(data) == (None, None, None)
+
+def test_route_registered_twice_is_refused():
+    router, _ = make_router()
+    with pytest.raises(ValueError):
+        router.route('ban', int)(lambda: None)
+
+def test_dispatch_calls_the_route_and_answers_unrouted_taps():
+    router, calls = make_router()
+    answered = []
+    
+    async def answer():
+        answered.append(True)
+    
+    def tap(data):
+        return SimpleNamespace(callback_query=SimpleNamespace(data=data, answer=answer))
+    
+    asyncio.run(router.dispatch(tap('ban_42'), None))
+    asyncio.run(router.dispatch(tap('nothing_here'), None))
+    assert calls == [('ban', (42,))]
+    assert answered == [True]
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+def test_failed_build_is_retried_by_the_next_search():
+    from search_index import UserSearch
+    users = {1: {'id': 1, 'first_name': "Alice", 'username': 'alice'}}
+    calls = []
+    
+    def entries():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("store unavailable")
+        return [(1, "Alice", 'alice')]
+    
+    search = UserSearch(entries)
+    
+    async def scenario():
+        with pytest.raises(OSError):
+            await search.search("alice", 10, users.get)
+        # Nothing builds now, so users added meanwhile are not held for a dead build
+        search.add(2, "Bob", 'bob')
+        assert search.building is None and not search.added
+        return await search.search("alice", 10, users.get)
+    
+    assert asyncio.run(scenario()) == [users[1]]
+    assert len(calls) == 2
@@ -0,0 +1,49 @@
+import asyncio
+
+def test_json_store_moves_into_sqlite(tmp_path):
+    from database import Database
+    from sqlite_database import SQLiteDatabase
+    
+    legacy = Database(str(tmp_path / 'data.json'), backend='json')
+    for uid in (1, 2, 3):
+        legacy.add_user(uid, f'user{uid}', f"User {uid}")
+    legacy.ban_user(3)
+    settled = legacy.add_pending_payment(1, 7, 12, 'shot-1')
+    pending = legacy.add_pending_payment(2, 30, 25, 'shot-2')
+    legacy.approve_payment(settled['id'])
+    legacy.add_cloned_bot(1, '123:token', 7)
+    legacy.map_messages(2, [500, 501])
+    legacy.set_paid_batches("Batch A")
+    asyncio.run(legacy.close())
+    
+    db = SQLiteDatabase(str(tmp_path / 'data.db'), str(tmp_path / 'data.json'))
+    assert db.get_user(2) == legacy.data['users']['2']
+    assert db.is_banned(3) and not db.is_banned(2)
+    assert [p['id'] for p in db.get_pending_payments()] == [pending['id']]
+    # The archived payment came along and is not pending again
+    assert db.approve_payment(settled['id']) is None
+    assert db.get_cloned_bot(1)['bot_token'] == '123:token'
+    assert db.get_user_from_msg(501) == 2
+    assert db.get_paid_batches() == "Batch A"
+    assert db.get_stats() == legacy.get_stats()
+    
+    # New payments never reuse an id the JSON store handed out
+    assert db.add_pending_payment(1, 1, 2, 'shot-3')['id'] == pending['id'] + 1
+
+def test_migration_runs_once(tmp_path):
+    from database import Database
+    from sqlite_database import SQLiteDatabase
+    
+    legacy = Database(str(tmp_path / 'data.json'), backend='json')
+    legacy.add_user(1, 'one', "One")
+    asyncio.run(legacy.close())
+    
+    SQLiteDatabase(str(tmp_path / 'data.db'), str(tmp_path / 'data.json')).conn.close()
+    # Later changes to the old file are not picked up again
+    legacy = Database(str(tmp_path / 'data.json'), backend='json')
+    legacy.add_user(2, 'two', "Two")
+    asyncio.run(legacy.close())
+    
+    db = SQLiteDatabase(str(tmp_path / 'data.db'), str(tmp_path / 'data.json'))
+    assert db.get_user(2) is None
+    assert db.get_stats()['total'] == 1
@@ -1,10 +1,37 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from database import db
+from albums import input_media, media_item
+from database import get_db
+from flood import ALLOW, MUTE, WARN
+from outbound import FORWARD
+from router import router
+import asyncio
+import html
 import logging
+import os
+import time
+from functools import partial
 
 logger = logging.getLogger(__name__)
 
+# single - header and content in one call where Telegram allows it
+# split  - always a header message followed by a copy of the content
+FORWARD_MODE = os.getenv('FORWARD_MODE', 'single')
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+# Forwards running at once across all users; the rest wait for the owner chat's budget anyway
+FORWARD_CONCURRENCY = int(os.getenv('FORWARD_CONCURRENCY', '32'))
+# How long shutdown waits for accepted forwards before dropping the rest
+FORWARD_DRAIN_TIMEOUT = float(os.getenv('FORWARD_DRAIN_TIMEOUT', '10'))
+
+# Forwarding cost keyed by Bot API calls per message or album (1 = single, 2 = split)
+FORWARD_STATS = {
+    1: {'messages': 0, 'seconds': 0.0},
+    2: {'messages': 0, 'seconds': 0.0}
+}
+
 # Fixed plans
 PLANS = [
     {'days': 1, 'price': 2},
@@ -15,6 +42,7 @@ PLANS = [
 UPI_ID = "thefatherofficial-3@okaxis"
 
 async def user_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     user = update.effective_user
     
     if db.is_banned(user.id):
@@ -32,68 +60,202 @@ Just Send msg ✍️"""
     
     keyboard = [
         [InlineKeyboardButton("📩 Send msg to Admin", callback_data="user_send")],
-        [InlineKeyboardButton("📚 Paid Batches List", callback_data="paid_batches")],
-        [InlineKeyboardButton("🤖 Want's to Clone Bot?", callback_data="clone_bot")],
-        [InlineKeyboardButton("📋 My Clone Bot", callback_data="my_clone")],
-        [InlineKeyboardButton("ℹ️ Help", callback_data="user_help")]
+        [InlineKeyboardButton("📚 Paid Batches List", callback_data="paid_batches")]
     ]
+    # Clone bots are only sold and hosted by the main bot
+    if not context.bot_data.get('IS_CLONE'):
+        keyboard.append([InlineKeyboardButton("🤖 Want's to Clone Bot?", callback_data="clone_bot")])
+        keyboard.append([InlineKeyboardButton("📋 My Clone Bot", callback_data="my_clone")])
+    keyboard.append([InlineKeyboardButton("ℹ️ Help", callback_data="user_help")])
     
     await update.message.reply_text(welcome, reply_markup=InlineKeyboardMarkup(keyboard))
 
+def forward_header(user):
+    return f"""
+📨 New Message from User
+━━━━━━━━━━━━━━━━
+👤 Name: {html.escape(user.first_name or '')}
+🆔 ID: <code>{user.id}</code>
+📱 Username: @{user.username or 'None'}
+
+💬 """
+
+def utf16_len(text):
+    # Telegram measures its limits in UTF-16 code units, so emoji and other astral characters count twice
+    return len(text.encode('utf-16-le')) // 2
+
+def too_long(error):
+    # Telegram's own verdict on a BadRequest, for whatever our count misses
+    return 'too long' in error.message.lower()
+
+async def forward_single(context, owner_id, msg, header):
+    # Header and content in one message; None when the content can't carry it
+    if msg.text:
+        text = header + html.escape(msg.text)
+        if utf16_len(text) > TEXT_LIMIT:
+            return None
+        send = context.bot.send_message(owner_id, text, parse_mode='HTML', rate_limit_args=FORWARD)
+    elif msg.photo or msg.video or msg.document or msg.audio or msg.animation or msg.voice:
+        caption = header + html.escape(msg.caption or '')
+        if utf16_len(caption) > CAPTION_LIMIT:
+            return None
+        send = context.bot.copy_message(
+            owner_id, msg.chat_id, msg.message_id, caption=caption, parse_mode='HTML', rate_limit_args=FORWARD
+        )
+    else:
+        return None
+    
+    try:
+        sent = await send
+    except BadRequest as e:
+        if not too_long(e):
+            raise
+        return None
+    return [sent.message_id]
+
+async def forward_split(context, owner_id, msg, header):
+    # Header as its own message, then an untouched copy of the content
+    sent = await context.bot.send_message(owner_id, header + "Content below:", parse_mode='HTML', rate_limit_args=FORWARD)
+    content = await context.bot.copy_message(owner_id, msg.chat_id, msg.message_id, rate_limit_args=FORWARD)
+    return [sent.message_id, content.message_id]
+
+class ForwardQueue:
+    # Forwards run as background tasks so the handler returns as soon as the message is
+    # accepted. They all go to the owner's chat and its per-chat budget, and waiting for it
+    # inside the handler would hold a concurrency slot per queued message. Each user's forwards
+    # still go out one at a time in arrival order. The tasks are ours, not the Application's,
+    # so stop() can bound how long shutdown waits for them.
+    def __init__(self, application, concurrency=FORWARD_CONCURRENCY):
+        self.application = application
+        # user_id -> [lock, forwards queued or running]; dropped when nobody needs it
+        self.users = {}
+        self.slots = asyncio.Semaphore(concurrency)
+        # task -> user_id for every forward not finished yet
+        self.tasks = {}
+    
+    def submit(self, user_id, coroutine):
+        task = asyncio.create_task(self.run(user_id, coroutine))
+        self.tasks[task] = user_id
+        task.add_done_callback(self.tasks.pop)
+    
+    async def run(self, user_id, coroutine):
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = self.users[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # The user's turn comes before a slot, like ChatOrderedProcessor
+            async with entry[0], self.slots:
+                await coroutine
+        except Exception as e:
+            # forward_messages answers the user itself; this is whatever got past that
+            logger.error(f"❌ Forward from {user_id} failed: {e!r}")
+        finally:
+            # A forward cancelled while still queued never started its coroutine
+            coroutine.close()
+            entry[1] -= 1
+            if not entry[1]:
+                del self.users[user_id]
+    
+    async def stop(self, timeout=FORWARD_DRAIN_TIMEOUT):
+        # After Application.stop(), while the bot can still send: finish the accepted
+        # forwards, but only for so long
+        if not self.tasks:
+            return
+        done, pending = await asyncio.wait(list(self.tasks), timeout=timeout)
+        if not pending:
+            return
+        users = sorted({self.tasks[task] for task in pending})
+        logger.warning(f"⚠️ Dropped {len(pending)} forward(s) after {timeout:g}s, from users {users}")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def queue_forward(context, user, messages):
+    context.bot_data['forwards'].submit(user.id, forward_messages(context, user, messages))
+
 async def handle_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     user = update.effective_user
     msg = update.message
     
     if db.is_banned(user.id):
         return
     
+    # Flooding users are dropped before they cost any API calls or saves
+    verdict = context.bot_data['flood'].check(user.id)
+    if verdict != ALLOW:
+        if verdict == WARN:
+            await msg.reply_text("⏳ You're sending messages too fast. Please wait a moment.")
+        elif verdict == MUTE:
+            await msg.reply_text("🔇 Too many messages. Your messages are paused for a while.")
+        return
+    
     db.add_user(user.id, user.username, user.first_name)
-    owner_id = int(context.bot_data.get('OWNER_ID'))
     
-    try:
-        header = f"""
-📨 New Message from User
-━━━━━━━━━━━━━━━━
-👤 Name: {user.first_name}
-🆔 ID: <code>{user.id}</code>
-📱 Username: @{user.username or 'None'}
+    if msg.media_group_id:
+        # The rest of the album joins in handle_media_message and it goes out as one group
+        context.bot_data['albums'].start(msg, partial(queue_forward, context, user))
+        return
+    
+    await queue_forward(context, user, [msg])
 
-💬 Content below:
-"""
-        sent = await context.bot.send_message(owner_id, header, parse_mode='HTML')
-        db.map_message(user.id, sent.message_id)
+async def forward_album(context, owner_id, messages, header):
+    # One send_media_group for the whole album, the header riding on the first caption if it fits
+    items = [media_item(m) for m in messages]
+    caption = header + html.escape(messages[0].caption or '')
+    if FORWARD_MODE == 'single' and utf16_len(caption) <= CAPTION_LIMIT:
+        media = [input_media(items[0], caption, 'HTML')] + [input_media(item) for item in items[1:]]
+        try:
+            sent = await context.bot.send_media_group(owner_id, media, rate_limit_args=FORWARD)
+            return [m.message_id for m in sent]
+        except BadRequest as e:
+            if not too_long(e):
+                raise
+    
+    header_sent = await context.bot.send_message(owner_id, header + "Album below:", parse_mode='HTML', rate_limit_args=FORWARD)
+    sent = await context.bot.send_media_group(owner_id, [input_media(item) for item in items], rate_limit_args=FORWARD)
+    return [header_sent.message_id] + [m.message_id for m in sent]
+
+async def forward_messages(context, user, messages):
+    # messages is a single message or every item of one album
+    msg = messages[0]
+    
+    try:
+        db = get_db(context)
+        owner_id = int(context.bot_data.get('OWNER_ID'))
+        started = time.perf_counter()
+        header = forward_header(user)
         
-        if msg.text:
-            content = await context.bot.send_message(owner_id, msg.text)
-            db.map_message(user.id, content.message_id)
-        elif msg.photo:
-            content = await context.bot.send_photo(owner_id, msg.photo[-1].file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.video:
-            content = await context.bot.send_video(owner_id, msg.video.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.document:
-            content = await context.bot.send_document(owner_id, msg.document.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.voice:
-            content = await context.bot.send_voice(owner_id, msg.voice.file_id)
-            db.map_message(user.id, content.message_id)
-        elif msg.audio:
-            content = await context.bot.send_audio(owner_id, msg.audio.file_id, caption=msg.caption or "")
-            db.map_message(user.id, content.message_id)
-        elif msg.video_note:
-            content = await context.bot.send_video_note(owner_id, msg.video_note.file_id)
-            db.map_message(user.id, content.message_id)
+        message_ids = None
+        if len(messages) > 1:
+            message_ids = await forward_album(context, owner_id, messages, header)
+        elif FORWARD_MODE == 'single':
+            message_ids = await forward_single(context, owner_id, msg, header)
+        if message_ids is None:
+            message_ids = await forward_split(context, owner_id, msg, header)
         
-        greeting = db.get_random_greeting()
-        await msg.reply_text(greeting)
+        # Every copy maps back to the user, so a reply to any album item reaches them
+        db.map_messages(user.id, message_ids)
         
-        logger.info(f"✅ Message from {user.id} forwarded")
+        # One call per message, plus one when the header went separately
+        stats = FORWARD_STATS[1 if len(message_ids) == len(messages) else 2]
+        stats['messages'] += 1
+        stats['seconds'] += time.perf_counter() - started
         
+        greeting = db.get_random_greeting()
+        await context.bot.send_message(msg.chat_id, greeting, rate_limit_args=FORWARD)
+        
+        logger.info(f"✅ {'Album' if len(messages) > 1 else 'Message'} from {user.id} forwarded")
+    
     except Exception as e:
         logger.error(f"❌ Error: {e}")
-        await msg.reply_text("❌ Failed to send message.")
+        try:
+            await msg.reply_text("❌ Failed to send message.")
+        except Exception as e:
+            logger.error(f"❌ Failure notice to {user.id} failed: {e}")
 
+@router.route('user_send')
 async def user_send_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -104,16 +266,20 @@ async def user_send_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "• Photos\n"
         "• Videos\n"
         "• Documents\n"
-        "• Voice messages"
+        "• Voice messages\n"
+        "• Stickers, GIFs and more"
     )
 
+@router.route('paid_batches')
 async def paid_batches_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
     text = db.get_paid_batches()
     await query.message.reply_text(f"📚 Paid Batches List\n━━━━━━━━━━━━━━━━\n\n{text}")
 
+@router.route('clone_bot')
 async def clone_bot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -129,13 +295,10 @@ async def clone_bot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
-async def plan_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@router.route('plan', int, int)
+async def plan_selected(update: Update, context: ContextTypes.DEFAULT_TYPE, days, price):
     query = update.callback_query
     
-    parts = query.data.split('_')
-    days = int(parts[1])
-    price = int(parts[2])
-    
     await query.answer()
     
     # Create UPI payment link
@@ -169,6 +332,7 @@ async def plan_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['selected_plan'] = {'days': days, 'price': price}
 
 async def handle_payment_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     if 'selected_plan' not in context.user_data:
         return
     
@@ -222,7 +386,9 @@ Payment ID: #{payment['id']}
         del context.user_data['selected_plan']
         logger.info(f"💳 Payment from {user.id} sent to owner")
 
+@router.route('my_clone')
 async def my_clone_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    db = get_db(context)
     query = update.callback_query
     await query.answer()
     
@@ -237,8 +403,8 @@ async def my_clone_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     from datetime import datetime
-    expiry = datetime.fromisoformat(clone['expiry'])
-    days_left = (expiry - datetime.now()).days
+    expiry = datetime.fromtimestamp(clone['expires_at'])
+    days_left = int((clone['expires_at'] - time.time()) // 86400)
     
     text = f"""
 🤖 Your Clone Bot
@@ -257,6 +423,7 @@ Your bot is running!
     
     await query.message.reply_text(text)
 
+@router.route('user_help')
 async def user_help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -289,6 +456,7 @@ Questions? Message admin!
     
     await query.message.reply_text(text)
 
+@router.route('cancel_payment')
 async def cancel_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer("❌ Cancelled")